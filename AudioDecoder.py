@@ -0,0 +1,148 @@
+import os
+import subprocess
+import time
+import numpy as np
+import pandas as pd
+import librosa
+import soundfile
+
+# the backends of the decoder (see AudioDecoder)
+DECODE_BACKENDS = ('librosa', 'native', 'ffmpeg')
+
+
+def ffmpeg_decode(song_path, sr=22050, offset=0.0, duration=None):
+    """
+    decode an audio file through a single ffmpeg process, which also down-mixes and resamples it (instead of
+    audioread piping the native rate to python and resampy resampling it there)
+    :param song_path: the path to the audio file
+    :param sr: (int) the sampling rate to decode to
+    :param offset: (float) start reading after this time (in seconds)
+    :param duration: (float) only decode this much audio (in seconds), None for the rest of the file
+    :return: (np array, int) the mono audio time series and its sampling rate
+    :raise: FileNotFoundError if the audio file does not exist
+    :raise: subprocess.CalledProcessError if ffmpeg could not decode the file
+    """
+    if not os.path.isfile(song_path):
+        raise FileNotFoundError(song_path)
+    command = ['ffmpeg', '-v', 'quiet', '-nostdin']
+    if offset:
+        command += ['-ss', str(offset)]
+    if duration is not None:
+        command += ['-t', str(duration)]
+    command += ['-i', song_path, '-f', 'f32le', '-ac', '1', '-ar', str(sr), 'pipe:1']
+    decoded = subprocess.run(command, stdout=subprocess.PIPE, check=True).stdout
+    return np.frombuffer(decoded, dtype=np.float32), sr
+
+
+class AudioDecoder:
+    """
+    A selectable audio decoding backend, returning the audio as librosa.load would (mono, float32, resampled).
+    'librosa' - librosa.load itself, mp3/m4a go through audioread (a new ffmpeg process streaming the native rate to
+    python) and are resampled in python,
+    'native' - the formats libsndfile reads are decoded in process, with no subprocess at all: wav, flac, ogg/vorbis,
+    aiff and, since libsndfile 1.1 (bundled by SoundFile 0.12), mp3. the others (m4a/aac...) go through ffmpeg as in
+    the 'ffmpeg' backend, a new process per file,
+    'ffmpeg' - a single ffmpeg process per file decodes, down-mixes and resamples it
+    """
+    def __init__(self, backend='librosa', res_type='kaiser_best'):
+        """
+        initializing the decoder
+        :param backend: (str) one of DECODE_BACKENDS
+        :param res_type: (str) the resampling mode of the 'librosa' and 'native' backends (see librosa.resample):
+                         'kaiser_best' (librosa's default), 'kaiser_fast' (several times faster, a slightly wider
+                         transition band) or 'scipy' (FFT based). ffmpeg always uses its own resampler
+        :raise: ValueError if the backend is unknown
+        """
+        if backend not in DECODE_BACKENDS:
+            raise ValueError('unknown decode backend {0}, expected one of {1}'.format(backend, DECODE_BACKENDS))
+        self.backend = backend
+        self.res_type = res_type
+
+    def __repr__(self):
+        return 'AudioDecoder({0!r}, {1!r})'.format(self.backend, self.res_type)
+
+    @property
+    def variant(self):
+        """
+        :return: (str) the name of the decoding, part of the cache key variant of the features it changes ('' for the
+                 default librosa decoding)
+        """
+        if self.backend == 'librosa' and self.res_type == 'kaiser_best':
+            return ''
+        if self.backend == 'ffmpeg':
+            return 'decode=ffmpeg'
+        return 'decode={0}/{1}'.format(self.backend, self.res_type)
+
+    def load(self, song_path, sr=22050, offset=0.0, duration=None):
+        """
+        decode an audio file
+        :param song_path: the path to the audio file
+        :param sr: (int) the sampling rate to decode to
+        :param offset: (float) start reading after this time (in seconds)
+        :param duration: (float) only decode this much audio (in seconds), None for the rest of the file
+        :return: (np array, int) the mono audio time series and its sampling rate
+        :raise: FileNotFoundError if the audio file does not exist
+        """
+        if self.backend == 'librosa':
+            return librosa.load(song_path, sr=sr, offset=offset, duration=duration, res_type=self.res_type)
+        if self.backend == 'native':
+            try:
+                with soundfile.SoundFile(song_path) as audio_file:
+                    native_sr = audio_file.samplerate
+                    audio_file.seek(min(int(offset * native_sr), audio_file.frames))
+                    frames = -1 if duration is None else int(duration * native_sr)
+                    y = audio_file.read(frames, dtype='float32', always_2d=True).T
+            except RuntimeError:
+                if not os.path.isfile(song_path):
+                    raise FileNotFoundError(song_path)
+                return ffmpeg_decode(song_path, sr, offset, duration)
+            y = librosa.to_mono(y)
+            if native_sr != sr:
+                y = librosa.resample(y, orig_sr=native_sr, target_sr=sr, res_type=self.res_type)
+            return y, sr
+        return ffmpeg_decode(song_path, sr, offset, duration)
+
+    def get_duration(self, song_path):
+        """
+        :param song_path: the path to the audio file
+        :return: (float) the duration of the file in seconds, without decoding it (where the format allows)
+        """
+        try:
+            return soundfile.info(song_path).duration
+        except RuntimeError:
+            return librosa.get_duration(filename=song_path)
+
+
+def decode_benchmark(song_paths, decoders=None, sr=22050):
+    """
+    compare the decoding time of several decoders over a set of audio files, per file format
+    :param song_paths: the paths to the audio files (of several formats)
+    :param decoders: the decoders (AudioDecoder) to compare, the first one is the reference the others' output is
+                     compared to. if None, librosa's default decoding against the native and ffmpeg backends with
+                     the fast resampling
+    :param sr: (int) the sampling rate to decode to
+    :return: (pandas DataFrame) a row per format and decoder: the number of files, the total decoding time, the
+             speedup over the reference and the maximal RMS difference from the reference output
+    """
+    if decoders is None:
+        decoders = [AudioDecoder(), AudioDecoder('native', 'kaiser_fast'), AudioDecoder('ffmpeg')]
+    rows = []
+    for song in song_paths:
+        song_format = os.path.splitext(song)[1].lstrip('.').lower()
+        reference = None
+        for decoder in decoders:
+            start = time.perf_counter()
+            y, _ = decoder.load(song, sr=sr)
+            elapsed = time.perf_counter() - start
+            if reference is None:
+                reference = y
+            length = min(len(y), len(reference))
+            rms_difference = np.sqrt(np.mean((y[:length] - reference[:length])**2)) if length else np.nan
+            rows.append({'format': song_format, 'decoder': repr(decoder), 'time': elapsed,
+                         'rms_difference': rms_difference})
+    report = pd.DataFrame(rows).groupby(['format', 'decoder'], sort=False).agg(
+        {'time': ['count', 'sum'], 'rms_difference': 'max'})
+    report.columns = ['files', 'time', 'rms_difference']
+    reference_time = report['time'].groupby(level='format').transform('first')
+    report.insert(2, 'speedup', reference_time / report['time'])
+    return report
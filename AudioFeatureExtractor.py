@@ -2,11 +2,392 @@ import pandas as pd
 import numpy as np
 import librosa
 import librosa.display
+import soundfile
 import copy
+import io
 import os
+import subprocess
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache, partial
 import warnings
+from PipelineProfiler import profile_stage
+from AudioDecoder import AudioDecoder
 warnings.filterwarnings('ignore')
 
+# the default excerpts of the preview extraction tier
+PREVIEW_SEGMENTS = 3
+PREVIEW_DURATION = 15.0
+PREVIEW_SR = 11025
+
+# the backends of the volume features (see loudness_features)
+LOUDNESS_BACKENDS = ('cqt', 'cqt_decimated', 'stft')
+
+# the labels of the feature vector, in its order
+FEATURE_LABELS = ['tempo', 'first_beat', 'max_volume(PW)', 'volume_sd(PW)', 'zcr', 'mean_fit_coefficient0',
+                  'mean_fit_coefficient1', 'mean_fit_coefficient2', 'mean_flatness', 'mean_harmonic_flatness']
+
+
+class SpectralAnalysis:
+    """
+    Analysis core of a single audio time series.
+    the complex spectrogram is computed once, the harmonic/percussive separation is done on it in the spectral
+    domain, and every spectral representation the features need is derived from that one matrix
+    """
+    def __init__(self, y, sr, n_fft=2048, hop_length=512):
+        """
+        compute the STFT of the audio time series and separate it to its harmonic and percussive parts
+        :param y: (np array) the audio time series
+        :param sr: (int) sampling rate of the audio
+        :param n_fft: (int) the FFT window size
+        :param hop_length: (int) number of samples between successive frames
+        """
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        stft = librosa.stft(y, n_fft=n_fft, hop_length=hop_length)
+        harmonic, percussive = librosa.decompose.hpss(stft)
+        self.magnitude = np.abs(stft)
+        self.harmonic_magnitude = np.abs(harmonic)
+        self.percussive_magnitude = np.abs(percussive)
+
+    @classmethod
+    def from_magnitudes(cls, magnitude, harmonic_magnitude, percussive_magnitude=None, sr=22050, n_fft=2048,
+                        hop_length=512):
+        """
+        create an analysis core from magnitude spectrograms that were already computed (see SpectrogramStore)
+        :param magnitude: (np array) the magnitude spectrogram
+        :param harmonic_magnitude: (np array) the magnitude of its harmonic part
+        :param percussive_magnitude: (np array) the magnitude of its percussive part, None for deriving it as
+                                     magnitude - harmonic_magnitude (the soft masks of the separation sum to 1)
+        :param sr: (int) sampling rate of the audio
+        :param n_fft: (int) the FFT window size
+        :param hop_length: (int) number of samples between successive frames
+        :return: an instance of this class
+        """
+        analysis = super(SpectralAnalysis, cls).__new__(cls)
+        analysis.sr = sr
+        analysis.n_fft = n_fft
+        analysis.hop_length = hop_length
+        analysis.magnitude = magnitude
+        analysis.harmonic_magnitude = harmonic_magnitude
+        if percussive_magnitude is None:
+            percussive_magnitude = np.maximum(magnitude - harmonic_magnitude, 0)
+        analysis.percussive_magnitude = percussive_magnitude
+        return analysis
+
+    def percussive_onset_envelope(self, mel_basis=None):
+        """
+        the onset strength envelope of the percussive part, computed the same way librosa.beat.beat_track does for
+        a time series (median aggregated log-power mel spectrogram), without going back to the time domain
+        :param mel_basis: (np array) the mel filterbank of the sampling rate and FFT size, built if not given
+        :return: (np array) the onset strength envelope
+        """
+        if mel_basis is None:
+            mel = librosa.feature.melspectrogram(S=self.percussive_magnitude**2, sr=self.sr)
+        else:
+            mel = mel_basis.dot(self.percussive_magnitude**2)
+        return librosa.onset.onset_strength(S=librosa.power_to_db(mel), sr=self.sr, hop_length=self.hop_length,
+                                            aggregate=np.median)
+
+
+class FeatureEngine:
+    """
+    The feature computations shared by all the extractors.
+    the bases that depend only on the sampling rate (the mel filterbank, the CQT frequencies and their perceptual
+    weights, the polynomial fitting matrix and the STFT to CQT interpolation) are built on the first song of every
+    sampling rate and kept, so a catalog of same-rate songs is analysed through them without rebuilding them per song
+    """
+    def __init__(self, n_fft=2048, hop_length=512, loudness='cqt'):
+        """
+        initializing the engine
+        :param n_fft: (int) the FFT window size
+        :param hop_length: (int) number of samples between successive frames
+        :param loudness: (str) the backend of the volume features, one of LOUDNESS_BACKENDS (see loudness_features)
+        :raise: ValueError if the loudness backend is unknown
+        """
+        if loudness not in LOUDNESS_BACKENDS:
+            raise ValueError('unknown loudness backend {0}, expected one of {1}'.format(loudness, LOUDNESS_BACKENDS))
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.loudness = loudness
+        self.fmin = librosa.note_to_hz('A1')
+        self.__bases = {}
+
+    def bases(self, sr):
+        """
+        the bases of a sampling rate, built on its first use
+        :param sr: (int) sampling rate of the audio
+        :return: (dict) 'mel' - the mel filterbank, 'cqt_freqs' - the frequencies of the CQT bins, 'weights' - their
+                 A-weighting, 'poly' - the least squares fitting matrix of a degree 2 polynomial over the FFT bins,
+                 'lower', 'upper', 'fraction' - the linear interpolation of the CQT bins between the FFT bins
+        """
+        if sr not in self.__bases:
+            fft_freqs = librosa.fft_frequencies(sr=sr, n_fft=self.n_fft)
+            cqt_freqs = librosa.cqt_frequencies(cqt_bins(sr, self.fmin), fmin=self.fmin)
+            position = np.interp(cqt_freqs, fft_freqs, np.arange(len(fft_freqs)))
+            lower = np.floor(position).astype(int)
+            self.__bases[sr] = {'mel': librosa.filters.mel(sr=sr, n_fft=self.n_fft),
+                                'cqt_freqs': cqt_freqs,
+                                'weights': librosa.A_weighting(cqt_freqs)[:, np.newaxis],
+                                'poly': np.linalg.pinv(np.vander(fft_freqs, 3)),
+                                'lower': lower,
+                                'upper': np.minimum(lower + 1, len(fft_freqs) - 1),
+                                'fraction': (position - lower)[:, np.newaxis]}
+        return self.__bases[sr]
+
+    def features(self, y, sr, stage=None, spectrogram_store=None, song_path=None):
+        """
+        compute all the features of an audio time series
+        :param y: (np array) the audio time series
+        :param sr: (int) sampling rate of the audio
+        :param stage: a function returning the context every stage runs in given its name (see profile_stage),
+                      None for no context
+        :param spectrogram_store: (SpectrogramStore) the analysis core is written to this store, None for not storing
+        :param song_path: the path to the audio file, its key in the spectrogram store (not stored if None)
+        :return: (dict) the features (keys = feature labels, values = feature values), ordered as FEATURE_LABELS
+        """
+        if stage is None:
+            stage = partial(profile_stage, None, None)
+        features = {}
+        with stage('stft_hpss'):
+            analysis = SpectralAnalysis(y, sr, n_fft=self.n_fft, hop_length=self.hop_length)
+        if spectrogram_store is not None and song_path is not None:
+            with stage('spectrogram_store'):
+                spectrogram_store.put(song_path, analysis)
+        with stage('beat'):
+            features['tempo'], features['first_beat'] = self.beat_features(analysis)
+        with stage('volume_cqt'):
+            features['max_volume(PW)'], features['volume_sd(PW)'] = self.volume_features(y, sr, analysis)
+        with stage('zcr'):
+            features['zcr'] = self.zcr(y)
+        with stage('poly'):
+            (features['mean_fit_coefficient0'], features['mean_fit_coefficient1'],
+             features['mean_fit_coefficient2']) = self.poly_features(analysis)
+        with stage('flatness'):
+            features['mean_flatness'], features['mean_harmonic_flatness'] = self.flatness(analysis)
+        return features
+
+    def beat_features(self, analysis):
+        """
+        :param analysis: (SpectralAnalysis) the analysis core of the audio time series
+        :return: (float, float) the tempo and the time of the first beat
+        """
+        onset_envelope = analysis.percussive_onset_envelope(self.bases(analysis.sr)['mel'])
+        tempo, beat_frames = librosa.beat.beat_track(onset_envelope=onset_envelope, sr=analysis.sr,
+                                                     hop_length=analysis.hop_length)
+        beat_times = librosa.frames_to_time(frames=beat_frames, sr=analysis.sr, hop_length=analysis.hop_length)
+        return tempo, beat_times[0]
+
+    def volume_features(self, y, sr, analysis=None):
+        """
+        the max and std of the perceptually weighted power (in dB relative to its maximum) over log-spaced frequency
+        bins from A1, computed by the loudness backend of the engine (see loudness_features)
+        :param y: (np array) the audio time series
+        :param sr: (int) sampling rate of the audio
+        :param analysis: (SpectralAnalysis) the analysis core of the audio time series, for the 'stft' backend
+                         (computed if not given)
+        :return: (float, float) the max and the std of the perceptually weighted power
+        """
+        bases = self.bases(sr)
+        n_bins = len(bases['cqt_freqs'])
+        if self.loudness == 'cqt':
+            power = np.abs(librosa.cqt(y, sr=sr, hop_length=self.hop_length, fmin=self.fmin, n_bins=n_bins))**2
+        elif self.loudness == 'cqt_decimated':
+            power = np.abs(librosa.cqt(y, sr=sr, hop_length=4 * self.hop_length, fmin=self.fmin, n_bins=n_bins))**2
+        else:
+            if analysis is None:
+                analysis = SpectralAnalysis(y, sr, n_fft=self.n_fft, hop_length=self.hop_length)
+            stft_power = analysis.magnitude**2
+            fraction = bases['fraction']
+            # the power the CQT gives a tone is proportional to the length of its filter, i.e. inverse to its frequency
+            power = ((1 - fraction) * stft_power[bases['lower']] + fraction * stft_power[bases['upper']]) / \
+                bases['cqt_freqs'][:, np.newaxis]
+        # the perceptual weighting of librosa.perceptual_weighting, with the weights of the bins kept
+        perceptual = bases['weights'] + librosa.power_to_db(power, ref=np.max)
+        return np.max(perceptual), np.std(perceptual)
+
+    @staticmethod
+    def zcr(y):
+        """
+        :param y: (np array) the audio time series
+        :return: (float) the zero crossing rate
+        """
+        zcr = librosa.feature.zero_crossing_rate(y, frame_length=y.shape[0], hop_length=y.shape[0] + 1)
+        # zc = np.nonzero(librosa.zero_crossings(y))[0]
+        return zcr[0][0]
+
+    def poly_features(self, analysis):
+        """
+        the coefficients of the polynomial (of degree 2) fitting every frame of the spectrogram, as
+        librosa.feature.poly_features fits them, averaged over the frames
+        :param analysis: (SpectralAnalysis) the analysis core of the audio time series
+        :return: (float, float, float) the mean constant, linear and quadratic coefficients
+        """
+        p2 = self.bases(analysis.sr)['poly'].dot(analysis.magnitude)
+        return np.mean(p2[2]), np.mean(p2[1]), np.mean(p2[0])
+
+    @staticmethod
+    def flatness(analysis):
+        """
+        :param analysis: (SpectralAnalysis) the analysis core of the audio time series
+        :return: (float, float) the mean flatness of the spectrogram and of its harmonic part
+        """
+        flatness = librosa.feature.spectral_flatness(S=analysis.magnitude)
+        harmonic_flatness = librosa.feature.spectral_flatness(S=analysis.harmonic_magnitude)
+        return np.mean(flatness), np.mean(harmonic_flatness)
+
+
+class StreamingFeatureExtractor:
+    """
+    Extract the features of a single audio file block by block, with a bounded memory.
+    the file is decoded in fixed-size chunks (librosa.stream) and analysed in windows of frames that carry enough
+    context on both sides for the STFT, the HPSS median filter and the CQT filters. the features are kept as running
+    aggregates (sums, maxima and a histogram of the CQT levels), so the peak memory does not depend on the length of
+    the file. only formats readable by soundfile (wav, flac, ogg...) can be streamed
+    """
+    def __init__(self, sr=22050, n_fft=2048, hop_length=512, block_frames=1024, context_frames=16,
+                 db_resolution=0.05):
+        """
+        initializing the extractor
+        :param sr: (int) the sampling rate the audio is resampled to
+        :param n_fft: (int) the FFT window size
+        :param hop_length: (int) number of samples between successive frames
+        :param block_frames: (int) number of frames analysed in each window
+        :param context_frames: (int) number of frames of context on each side of a window, must cover half of the HPSS
+                               median filter and half of the longest CQT filter
+        :param db_resolution: (float) the resolution (in dB) of the histogram the volume deviation is computed from
+        """
+        self.sr = sr
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.block_frames = block_frames
+        self.context_frames = context_frames
+        self.fmin = librosa.note_to_hz('A1')
+        self.n_bins = 84
+        self.__engine = feature_engine(n_fft, hop_length)
+        # the CQT power in dB is bounded from below by amin=1e-10 of power_to_db
+        self.__db_edges = np.arange(-100.0, 100.0 + db_resolution, db_resolution)
+        self.__db_centers = (self.__db_edges[:-1] + self.__db_edges[1:]) / 2
+
+    def extract(self, song_path):
+        """
+        extract the features of the song
+        :param song_path: the path to the audio file
+        :return: (dict) the features (keys = feature labels, values = feature values), ordered as the feature vector
+                 of SingleAudioFeatureExtractor
+        """
+        info = soundfile.info(song_path)
+        self.__reset(int(np.ceil(info.frames * self.sr / info.samplerate)))
+        block_samples = self.block_frames * self.hop_length
+        context_samples = self.context_frames * self.hop_length
+        buffer = np.zeros(0, dtype=np.float32)
+        left_context = 0
+        for chunk in librosa.stream(song_path, block_length=1, frame_length=block_samples, hop_length=block_samples):
+            if info.samplerate != self.sr:
+                chunk = librosa.resample(chunk, orig_sr=info.samplerate, target_sr=self.sr)
+            buffer = np.concatenate((buffer, chunk))
+            while len(buffer) >= left_context + block_samples + context_samples:
+                self.__analyse_window(buffer[:left_context + block_samples + context_samples], left_context, False)
+                buffer = buffer[left_context + block_samples - context_samples:]
+                left_context = context_samples
+        self.__analyse_window(buffer, left_context, True)
+        return self.__features()
+
+    def __reset(self, total_samples):
+        """
+        reset the running aggregates before a new song
+        :param total_samples: (int) the (expected) length of the resampled audio time series
+        """
+        self.__position = 0
+        self.__frames = 0
+        self.__zcr_stop = total_samples - total_samples // 2
+        self.__crossings = 0
+        self.__onset_envelope = []
+        self.__max_mel_db = -np.inf
+        self.__max_cqt_db = np.full(self.n_bins, -np.inf)
+        self.__cqt_histogram = np.zeros((self.n_bins, len(self.__db_centers)), dtype=np.int64)
+        self.__poly_sum = np.zeros(3)
+        self.__flatness_sum = 0.0
+        self.__harmonic_flatness_sum = 0.0
+
+    def __analyse_window(self, y, left_context, final):
+        """
+        update the running aggregates with the frames centered in a window (not in its context)
+        :param y: (np array) the audio time series of the window, including its context
+        :param left_context: (int) number of samples of context at the start of the window
+        :param final: (bool) True for the last window of the song, which has no context at its end
+        """
+        kept_samples = len(y) - left_context if final else self.block_frames * self.hop_length
+        first = left_context // self.hop_length
+        last = None if final else first + self.block_frames
+        kept = slice(first, last)
+
+        stft = librosa.stft(y, n_fft=self.n_fft, hop_length=self.hop_length)
+        harmonic, percussive = librosa.decompose.hpss(stft)
+        magnitude = np.abs(stft[:, kept])
+        self.__frames += magnitude.shape[1]
+
+        # onset strength of the percussive part, the previous frame is needed for the first difference
+        mel = self.__engine.bases(self.sr)['mel'].dot(np.abs(percussive[:, max(first - 1, 0):last])**2)
+        mel_db = librosa.power_to_db(mel, top_db=None)
+        self.__max_mel_db = max(self.__max_mel_db, np.max(mel_db))
+        mel_db = np.maximum(mel_db, self.__max_mel_db - 80.0)
+        self.__onset_envelope.append(np.median(np.maximum(0.0, mel_db[:, 1:] - mel_db[:, :-1]), axis=0))
+
+        cqt = np.abs(librosa.cqt(y, sr=self.sr, hop_length=self.hop_length, fmin=self.fmin, n_bins=self.n_bins))
+        cqt_db = 10.0 * np.log10(np.maximum(1e-10, cqt[:, kept]**2))
+        self.__max_cqt_db = np.maximum(self.__max_cqt_db, np.max(cqt_db, axis=1))
+        levels = np.clip(np.digitize(cqt_db, self.__db_edges) - 1, 0, len(self.__db_centers) - 1)
+        levels += np.arange(self.n_bins)[:, np.newaxis] * len(self.__db_centers)
+        self.__cqt_histogram += np.bincount(levels.ravel(),
+                                            minlength=self.__cqt_histogram.size).reshape(self.__cqt_histogram.shape)
+
+        self.__poly_sum += np.sum(self.__engine.bases(self.sr)['poly'].dot(magnitude), axis=1)
+        self.__flatness_sum += np.sum(librosa.feature.spectral_flatness(S=magnitude))
+        self.__harmonic_flatness_sum += np.sum(librosa.feature.spectral_flatness(S=np.abs(harmonic[:, kept])))
+
+        # the zero crossing rate of the full extraction counts the crossings of the first half of the song only
+        window_start = self.__position - left_context
+        start = max(left_context, 1)
+        stop = min(left_context + kept_samples, self.__zcr_stop - window_start)
+        if stop > start:
+            signs = np.signbit(np.where(np.abs(y[start - 1:stop]) <= 1e-10, 0.0, y[start - 1:stop]))
+            self.__crossings += np.count_nonzero(signs[1:] != signs[:-1])
+        self.__position += kept_samples
+
+    def __features(self):
+        """
+        compute the features from the running aggregates
+        :return: (dict) the features (keys = feature labels, values = feature values)
+        """
+        features = {}
+        # pad the lag and the framing shift as librosa.onset.onset_strength does
+        onset_envelope = np.concatenate([np.zeros(1 + self.n_fft // (2 * self.hop_length))] + self.__onset_envelope)
+        tempo, beat_frames = librosa.beat.beat_track(onset_envelope=onset_envelope[:self.__frames], sr=self.sr,
+                                                     hop_length=self.hop_length)
+        beat_times = librosa.frames_to_time(frames=beat_frames, sr=self.sr, hop_length=self.hop_length)
+        features['tempo'] = tempo
+        features['first_beat'] = beat_times[0]
+
+        # perceptual weighting of the CQT power in dB relative to its maximum, clipped at 80 dB below it
+        weights = librosa.A_weighting(librosa.cqt_frequencies(self.n_bins, fmin=self.fmin))
+        ref = np.max(self.__max_cqt_db)
+        perceptual = weights[:, np.newaxis] + np.maximum(self.__db_centers - ref, -80.0)[np.newaxis, :]
+        count = np.sum(self.__cqt_histogram)
+        mean = np.sum(perceptual * self.__cqt_histogram) / count
+        features['max_volume(PW)'] = np.max(weights + np.maximum(self.__max_cqt_db - ref, -80.0))
+        features['volume_sd(PW)'] = np.sqrt(np.sum((perceptual - mean)**2 * self.__cqt_histogram) / count)
+
+        features['zcr'] = self.__crossings / self.__position
+        features['mean_fit_coefficient0'] = self.__poly_sum[2] / self.__frames
+        features['mean_fit_coefficient1'] = self.__poly_sum[1] / self.__frames
+        features['mean_fit_coefficient2'] = self.__poly_sum[0] / self.__frames
+        features['mean_flatness'] = self.__flatness_sum / self.__frames
+        features['mean_harmonic_flatness'] = self.__harmonic_flatness_sum / self.__frames
+        return features
+
 
 class AudioFeatureExtractor:
     """
@@ -24,22 +405,46 @@ class AudioFeatureExtractor:
             raise ValueError('{} is not a directory path'.format(dir_path))
         return instance
 
-    def __init__(self, dir_path):
+    def __init__(self, dir_path, cache=None, streaming=False, profiler=None, audio_store=None, loudness='cqt',
+                 spectrogram_store=None, duplicates=None, decoder=None):
         """
         initializing the instance
         :param dir_path: the path to the given directory where all the audio files are
+        :param cache: (FeatureCache) a persistent feature cache to look songs up in before extracting them,
+                      None for always extracting
+        :param streaming: (bool) if True, every song is decoded and analysed block by block with a bounded memory
+                          (see StreamingFeatureExtractor)
+        :param profiler: (PipelineProfiler) records every stage of every song, None for no profiling
+        :param audio_store: (DecodedAudioStore) songs are decoded once into this store and memory-mapped from it
+                            afterwards, None for always decoding
+        :param loudness: (str) the backend of the volume features, one of LOUDNESS_BACKENDS (see loudness_features)
+        :param spectrogram_store: (SpectrogramStore) the analysis core of every extracted song is written to this
+                                  store, so new spectral features can be computed without decoding the songs again
+                                  (not in streaming mode, and not for songs found in the cache)
+        :param duplicates: (DuplicateIndex) a song that is a near-duplicate of a song in this index (a re-upload of the
+                           same recording) gets the features of that song instead of being extracted, None for
+                           extracting every song
+        :param decoder: (AudioDecoder) the decoding backend and resampling mode of the songs, None for librosa.load
+                        (the streaming mode always decodes with librosa.stream)
         """
         self.dir_path = dir_path
-        self.file_types = ['mp3', 'wav']
+        self.cache = cache
+        self.streaming = streaming
+        self.profiler = profiler
+        self.audio_store = audio_store
+        self.loudness = loudness
+        self.engine = feature_engine(loudness=loudness)
+        self.spectrogram_store = spectrogram_store
+        self.duplicates = duplicates
+        self.decoder = decoder
+        self.file_types = ['mp3', 'wav', 'm4a']
         self.file_names = [f for f in os.listdir(dir_path) if self.insert_to_files(f)]
         # self.__features = {'tempo': [], 'first_beat': [], 'max_volume(dB)': [],
         #                    'volume_sd(dB)': [], 'max_volume(PW)': [], 'volume_sd(PW)': [], 'zero_crossing': [],
         #                    'zcr': [], 'mean_fit_coefficient0': [], 'mean_fit_coefficient1': [],
         #                    'mean_fit_coefficient2': [], 'mean_flatness': [], 'mean_harmonic_flatness': []}
 
-        self.__features = {'tempo': [], 'first_beat': [], 'max_volume(PW)': [], 'volume_sd(PW)': [], 'zcr': [],
-                           'mean_fit_coefficient0': [], 'mean_fit_coefficient1': [], 'mean_fit_coefficient2': [],
-                           'mean_flatness': [], 'mean_harmonic_flatness': []}
+        self.__features = {label: [] for label in FEATURE_LABELS}
 
     def insert_to_files(self, file_path):
         """
@@ -53,85 +458,279 @@ class AudioFeatureExtractor:
         data = pd.DataFrame(self.__features)
         return str(data.reindex(data['song']))
 
-    def extract_features(self):
+    def extract_features(self, workers=None, checkpoint=None, prefetch=None, prefetch_memory=512 * 1024 * 1024,
+                         queue=None, poll_interval=5.0):
         """
         extract the features for each song in directory
+        :param workers: (int) number of worker processes. if given (and greater than 1) the songs are decoded and
+                        analysed in parallel by a process pool, a song that fails gets a row of NaN values
+        :param checkpoint: (ExtractionCheckpoint) if given, the features of every song are checkpointed as soon as it
+                           is done, and songs whose file did not change since they were checkpointed are skipped
+        :param prefetch: (int) if given, a pool of this many threads decodes the next songs while the current one is
+                         analysed (not with workers, streaming or a profiler: the profiler measures the CPU time and
+                         the memory peak of the whole process, so the decoding threads would be counted in the
+                         analysis stages)
+        :param prefetch_memory: (int) the memory budget (in bytes) of the decoded songs waiting to be analysed, no
+                                more songs are prefetched while it is exceeded
+        :param queue: (ExtractionQueue) if given, this process is one of many workers (on any host sharing the
+                      directory and the queue) that claim the songs from the queue, the features of all the songs are
+                      returned once the whole queue is done (not with workers, checkpoint or prefetch)
+        :param poll_interval: (float) number of seconds a queue worker waits between polls once all the remaining
+                              songs are leased by other workers
         :return: (pandas DataFrame) the features for all the songs
+        :raise: ValueError if prefetching is asked for in streaming mode or with a profiler, or the queue with another
+                mode
         """
+        if queue is not None:
+            if (workers is not None and workers > 1) or checkpoint is not None or prefetch:
+                raise ValueError('a queue worker cannot be combined with workers, checkpoint or prefetch')
+            return self.__extract_features_queued(queue, poll_interval)
+        if workers is not None and workers > 1:
+            return self.__extract_features_parallel(workers, checkpoint)
+        if prefetch is not None and prefetch > 0:
+            if self.streaming:
+                raise ValueError('streaming mode decodes while analysing, songs cannot be prefetched')
+            if self.profiler is not None:
+                raise ValueError('the profiler measures the whole process, songs cannot be prefetched while profiling')
+            return self.__extract_features_prefetched(prefetch, prefetch_memory, checkpoint)
+        variant = cache_variant(self.streaming, self.loudness, self.decoder)
         for song in self.file_names:
             song = os.path.join(self.dir_path, song)
-            y, sr = librosa.load(song)
-            y_harmonic, y_percussive = librosa.effects.hpss(y)
-            self.__beat_features(y_percussive, sr)
-            self.__volume_features(y, sr)
-            self.__zcr(y)
-            self.__poly_features(y)
-            self.__flatness(y, y_harmonic)
+            if checkpoint is not None:
+                song_features = checkpoint.get(song, variant)
+                if song_features is not None:
+                    self.__append_features(song_features)
+                    continue
+                # a failing song gets a NaN row and no checkpoint, so it is retried by the next run
+                song_features = song_features_or_none(song, self.cache, self.streaming, self.profiler,
+                                                      self.audio_store, self.loudness, self.spectrogram_store,
+                                                      self.duplicates, self.decoder)
+                self.__append_features(song_features)
+                if song_features is not None:
+                    checkpoint.put(song, song_features, variant)
+                continue
+            self.__extract_song(song)
 
         ans = pd.DataFrame(self.__features, index=self.file_names)
         return ans
 
-    def __beat_features(self, y_percussive, sr):
+    def iter_features(self, recursive=True):
         """
-        add the beat features to their list
-        :param y_percussive: (np array) the percussive part of the original audio time series
-        :param sr: (int) sampling rate of the audio
+        extract the features of the songs one at a time, walking the directory lazily (nested directories included),
+        so neither the list of files nor the features of the whole library are held in memory
+        :param recursive: (bool) if True, the songs in all the nested directories are extracted as well
+        :return: a generator of (path, pandas Series) - the path to every audio file and its features (NaN values
+                 for a song that could not be processed), as soon as the song is done
+        """
+        for song in scan_audio_files(self.dir_path, self.file_types, recursive):
+            song_features = song_features_or_none(song, cache=self.cache, streaming=self.streaming,
+                                                  profiler=self.profiler, audio_store=self.audio_store,
+                                                  loudness=self.loudness, spectrogram_store=self.spectrogram_store,
+                                                  duplicates=self.duplicates, decoder=self.decoder)
+            yield song, pd.Series(song_features, index=list(self.__features.keys()), name=song, dtype=float)
+
+    def __extract_song(self, song):
         """
-        tempo, beat_frames = librosa.beat.beat_track(y=y_percussive, sr=sr)
-        beat_times = librosa.frames_to_time(frames=beat_frames, sr=sr)
-        self.__features['tempo'].append(tempo)
-        self.__features['first_beat'].append(beat_times[0])
+        extract the features of a single song in directory (or get them from the cache) and add them to their lists
+        :param song: the path to the audio file
+        :return: (dict) the features of the song (keys = feature labels, values = feature values)
+        """
+        variant = cache_variant(self.streaming, self.loudness, self.decoder)
+        if self.cache is not None:
+            with profile_stage(self.profiler, song, 'cache'):
+                cache_key = self.cache.key(song, variant=variant)
+                song_features = self.cache.get(cache_key)
+            if song_features is not None:
+                self.__append_features(song_features)
+                return song_features
+        if self.duplicates is not None:
+            with profile_stage(self.profiler, song, 'fingerprint'):
+                fingerprint = self.duplicates.fingerprint(song)
+                song_features = self.duplicates.find(fingerprint, variant)[1]
+            if song_features is not None:
+                self.__append_features(song_features)
+                return song_features
+        if self.streaming:
+            with profile_stage(self.profiler, song, 'streaming'):
+                song_features = StreamingFeatureExtractor().extract(song)
+            self.__append_features(song_features)
+        else:
+            with profile_stage(self.profiler, song, 'decode'):
+                y, sr = load_audio(song, self.audio_store, decoder=self.decoder)
+            song_features = self.__analyse_song(song, y, sr)
+        if self.cache is not None:
+            self.cache.put(cache_key, song_features)
+        if self.duplicates is not None:
+            self.duplicates.add(song, fingerprint, {label: float(value) for label, value in song_features.items()},
+                                variant)
+        return song_features
 
-    def __volume_features(self, y, sr):
+    def __analyse_song(self, song, y, sr):
         """
-        add the volume features to their list
+        compute the features of a decoded song and add them to their lists
+        :param song: the path to the audio file
         :param y: (np array) the audio time series
         :param sr: (int) sampling rate of the audio
+        :return: (dict) the features of the song (keys = feature labels, values = feature values)
         """
-        fmin = librosa.note_to_hz('A1')
-        c = np.abs(librosa.cqt(y, sr=sr, fmin=fmin))
-        # amplitude_to_decibels = librosa.amplitude_to_db(c, ref=np.max)
-        # self.__features['max_volume(dB)'].append(np.max(amplitude_to_decibels))
-        # self.__features['volume_sd(dB)'].append(np.std(amplitude_to_decibels))
+        song_features = self.engine.features(y, sr, partial(profile_stage, self.profiler, song),
+                                             self.spectrogram_store, song)
+        self.__append_features(song_features)
+        return song_features
 
-        freqs = librosa.cqt_frequencies(c.shape[0], fmin=fmin)
-        perceptual_cqt = librosa.perceptual_weighting(c**2, freqs, ref=np.max)
-        self.__features['max_volume(PW)'].append(np.max(perceptual_cqt))
-        self.__features['volume_sd(PW)'].append(np.std(perceptual_cqt))
+    def __extract_features_prefetched(self, prefetch, prefetch_memory, checkpoint=None):
+        """
+        extract the features for each song in directory, overlapping the decoding of the next songs (in a thread
+        pool) with the analysis of the current one
+        :param prefetch: (int) number of decoding threads, and of songs decoded ahead
+        :param prefetch_memory: (int) the memory budget (in bytes) of the decoded songs waiting to be analysed
+        :param checkpoint: (ExtractionCheckpoint) checkpoints every song as soon as it is done, None for no
+                           checkpointing
+        :return: (pandas DataFrame) the features for all the songs, ordered as the file names
+        """
+        song_paths = [os.path.join(self.dir_path, song) for song in self.file_names]
+        variant = cache_variant(self.streaming, self.loudness, self.decoder)
+        in_flight = deque()
+        next_song = 0
+        with ThreadPoolExecutor(max_workers=prefetch) as decoding_pool:
+            for song in song_paths:
+                # the current song is always submitted, the ones after it only within the count and memory budget
+                while next_song < len(song_paths) and (not in_flight or (
+                        len(in_flight) <= prefetch and self.__waiting_bytes(in_flight) < prefetch_memory)):
+                    in_flight.append(decoding_pool.submit(self.__prefetch_song, song_paths[next_song], checkpoint))
+                    next_song += 1
+                (known_features, cache_key, fingerprint), audio = in_flight.popleft().result()
+                if known_features is not None:
+                    self.__append_features(known_features)
+                    continue
+                song_features = self.__analyse_song(song, *audio)
+                if self.cache is not None:
+                    self.cache.put(cache_key, song_features)
+                if self.duplicates is not None:
+                    self.duplicates.add(song, fingerprint,
+                                        {label: float(value) for label, value in song_features.items()}, variant)
+                if checkpoint is not None:
+                    checkpoint.put(song, song_features, variant)
+        ans = pd.DataFrame(self.__features, index=self.file_names)
+        return ans
 
-    def __zcr(self, y):
+    def __prefetch_song(self, song, checkpoint=None):
         """
-        add the zero crossing features to their list
-        :param y: (np array) the audio time series
+        decode a song ahead of its analysis (in a decoding thread), unless its features are already known
+        :param song: the path to the audio file
+        :param checkpoint: (ExtractionCheckpoint) the checkpoint the features may be known from
+        :return: ((dict, str, tuple), (np array, int)) - the known features (None if the song has to be analysed), its
+                 cache key (None without a cache) and its fingerprint (None without a duplicate index), and the
+                 decoded audio time series and its sampling rate (None if the features are known)
         """
-        zcr = librosa.feature.zero_crossing_rate(y, frame_length=y.shape[0],
-                                                 hop_length=y.shape[0] + 1)
-        # zc = np.nonzero(librosa.zero_crossings(y))[0]
-        # self.__features['zero_crossing'].append(len(zc))
-        self.__features['zcr'].append(zcr[0][0])
+        variant = cache_variant(self.streaming, self.loudness, self.decoder)
+        if checkpoint is not None:
+            song_features = checkpoint.get(song, variant)
+            if song_features is not None:
+                return (song_features, None, None), None
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.key(song, variant=variant)
+            song_features = self.cache.get(cache_key)
+            if song_features is not None:
+                return (song_features, cache_key, None), None
+        fingerprint = None
+        if self.duplicates is not None:
+            fingerprint = self.duplicates.fingerprint(song)
+            song_features = self.duplicates.find(fingerprint, variant)[1]
+            if song_features is not None:
+                return (song_features, cache_key, fingerprint), None
+        return (None, cache_key, fingerprint), load_audio(song, self.audio_store, decoder=self.decoder)
 
-    def __poly_features(self, y):
+    @staticmethod
+    def __waiting_bytes(in_flight):
         """
-        add the coefficients fitting of the polynomial(of degree 2) to spectrogram to their list
-        :param y: (np array) the audio time series
+        the memory held by the decoded songs that are waiting to be analysed
+        :param in_flight: the futures of the prefetched songs
+        :return: (int) number of bytes
         """
-        s = np.abs(librosa.stft(y))
-        p2 = librosa.feature.poly_features(S=s, order=2)
-        self.__features['mean_fit_coefficient0'].append(np.mean(p2[2]))
-        self.__features['mean_fit_coefficient1'].append(np.mean(p2[1]))
-        self.__features['mean_fit_coefficient2'].append(np.mean(p2[0]))
+        return sum(future.result()[1][0].nbytes for future in in_flight
+                   if future.done() and future.exception() is None and future.result()[1] is not None)
 
-    def __flatness(self, y, y_harmonic):
+    def __extract_features_queued(self, queue, poll_interval):
         """
-        add the flatness features to their list
-        :param y: (np array) the audio time series
-        :param y_harmonic: (np array) the harmonic part of the original audio time series
-        :return:
+        extract the songs in directory as one of the workers of a shared queue: claim a song, extract it while
+        renewing its lease and write its features back, until no song is left to claim. then wait for the songs
+        leased by other workers (claiming them if their lease expires)
+        :param queue: (ExtractionQueue) the queue of the directory
+        :param poll_interval: (float) number of seconds to wait between polls
+        :return: (pandas DataFrame) the features for all the songs, ordered as the file names (NaN values for the
+                 songs that failed)
+        """
+        # the songs are queued by their name in directory, so the hosts may mount the directory at different paths
+        queue.add(self.file_names)
+        owner = queue.worker_id()
+        while not queue.is_finished():
+            song = queue.claim(owner)
+            if song is None:
+                time.sleep(poll_interval)
+                continue
+            with queue.keep_alive(song, owner):
+                song_features = song_features_or_none(os.path.join(self.dir_path, song), cache=self.cache,
+                                                      streaming=self.streaming, profiler=self.profiler,
+                                                      audio_store=self.audio_store, loudness=self.loudness,
+                                                      spectrogram_store=self.spectrogram_store,
+                                                      duplicates=self.duplicates, decoder=self.decoder)
+            queue.complete(song, owner, song_features)
+        results = queue.results()
+        for song in self.file_names:
+            self.__append_features(results.get(song))
+        ans = pd.DataFrame(self.__features, index=self.file_names)
+        return ans
+
+    def __extract_features_parallel(self, workers, checkpoint=None):
+        """
+        extract the features for each song in directory using a pool of worker processes
+        :param workers: (int) number of worker processes
+        :param checkpoint: (ExtractionCheckpoint) checkpoints every song as soon as its result arrives, None for no
+                           checkpointing
+        :return: (pandas DataFrame) the features for all the songs, ordered as the file names
+        """
+        song_paths = [os.path.join(self.dir_path, song) for song in self.file_names]
+        checkpointed = {}
+        if checkpoint is not None:
+            variant = cache_variant(self.streaming, self.loudness, self.decoder)
+            checkpointed = {song: checkpoint.get(song, variant) for song in song_paths}
+        pending = [song for song in song_paths if checkpointed.get(song) is None]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # map keeps the results in the order of the given songs
+            if self.profiler is None:
+                results = executor.map(partial(song_features_or_none, cache=self.cache, streaming=self.streaming,
+                                               audio_store=self.audio_store, loudness=self.loudness,
+                                               spectrogram_store=self.spectrogram_store, duplicates=self.duplicates,
+                                               decoder=self.decoder), pending)
+                results = ((song_features, []) for song_features in results)
+            else:
+                results = executor.map(partial(profiled_song_features, profiler=self.profiler, cache=self.cache,
+                                               streaming=self.streaming, audio_store=self.audio_store,
+                                               loudness=self.loudness, spectrogram_store=self.spectrogram_store,
+                                               duplicates=self.duplicates, decoder=self.decoder), pending)
+            for song in song_paths:
+                if checkpointed.get(song) is not None:
+                    self.__append_features(checkpointed[song])
+                    continue
+                song_features, records = next(results)
+                self.__append_features(song_features)
+                for record in records:
+                    self.profiler.add(record)
+                if checkpoint is not None and song_features is not None:
+                    checkpoint.put(song, song_features, variant)
+        ans = pd.DataFrame(self.__features, index=self.file_names)
+        return ans
+
+    def __append_features(self, song_features):
         """
-        flatness = librosa.feature.spectral_flatness(y)
-        harmonic_flatness = librosa.feature.spectral_flatness(y_harmonic)
-        self.__features['mean_flatness'].append(np.mean(flatness))
-        self.__features['mean_harmonic_flatness'].append(np.mean(harmonic_flatness))
+        add the features of a single song to their lists
+        :param song_features: (dict) the features of the song (keys = feature labels, values = feature values),
+                              None for a song that could not be processed (adds NaN values)
+        """
+        for label in self.__features:
+            self.__features[label].append(np.nan if song_features is None else song_features[label])
 
 
 class SingleAudioFeatureExtractor:
@@ -142,25 +741,144 @@ class SingleAudioFeatureExtractor:
         """
         check if the given song path is a valid path, else not creating the instance
         :param song_path: the given song path
+        :param kwargs: 'cache' - (FeatureCache) if the song is in the given cache, the audio is not decoded at all
+                       'streaming' - (bool) if True, the audio is not loaded as a whole but streamed on extraction
+                       'preview' - (bool) if True, only a few excerpts of the song are decoded, at a reduced sampling
+                       rate ('preview_segments', 'preview_duration' and 'preview_sr', see load_excerpts)
+                       'profiler' - (PipelineProfiler) records the decoding as well
+                       'audio_store' - (DecodedAudioStore) the song is decoded from this store (see load_audio)
+                       'loudness' - (str) the backend of the volume features, part of the cache key
+                       'duplicates' - (DuplicateIndex) if a near-duplicate of the song is in the given index, the audio
+                       is not decoded at all
+                       'decoder' - (AudioDecoder) the decoding backend of the song, part of the cache key
         :return: an instance of this class iff the given song path is a valid audio file path, else return None
         """
         try:
             instance = super(SingleAudioFeatureExtractor, cls).__new__(cls)
-            instance.__audio_time_series, instance.__sampling_rate = librosa.load(song_path)
+            instance.__cached_features = None
+            profiler = kwargs.get('profiler')
+            audio_store = kwargs.get('audio_store')
+            streaming = kwargs.get('streaming', False)
+            preview = kwargs.get('preview', False)
+            excerpts = {'segments': kwargs.get('preview_segments', PREVIEW_SEGMENTS),
+                        'duration': kwargs.get('preview_duration', PREVIEW_DURATION),
+                        'sr': kwargs.get('preview_sr', PREVIEW_SR)}
+            cache = kwargs.get('cache')
+            duplicates = kwargs.get('duplicates')
+            decoder = kwargs.get('decoder')
+            if preview:
+                # the preview tier never streams (see __init__)
+                variant = ','.join(part for part in ('preview:{segments}x{duration}@{sr}'.format(**excerpts),
+                                                     cache_variant(False, kwargs.get('loudness', 'cqt'), decoder))
+                                   if part)
+            else:
+                variant = cache_variant(streaming, kwargs.get('loudness', 'cqt'), decoder)
+            instance.__variant = variant
+            instance.__fingerprint = None
+            if cache is not None:
+                with profile_stage(profiler, song_path, 'cache'):
+                    instance.__cache_key = cache.key(song_path, variant=variant)
+                    instance.__cached_features = cache.get(instance.__cache_key)
+            if instance.__cached_features is None and duplicates is not None:
+                with profile_stage(profiler, song_path, 'fingerprint'):
+                    instance.__fingerprint = duplicates.fingerprint(song_path)
+                    instance.__cached_features = duplicates.find(instance.__fingerprint, variant)[1]
+            if instance.__cached_features is None:
+                if preview:
+                    with profile_stage(profiler, song_path, 'decode'):
+                        instance.__audio_time_series, instance.__sampling_rate = load_excerpts(song_path,
+                                                                                               audio_store=audio_store,
+                                                                                               decoder=decoder,
+                                                                                               **excerpts)
+                elif streaming:
+                    if not os.path.isfile(song_path):
+                        raise FileNotFoundError(song_path)
+                else:
+                    with profile_stage(profiler, song_path, 'decode'):
+                        instance.__audio_time_series, instance.__sampling_rate = load_audio(song_path, audio_store,
+                                                                                            decoder=decoder)
             return instance
         except FileNotFoundError:
             return None
 
-    def __init__(self, song_path):
+    def __init__(self, song_path, cache=None, streaming=False, preview=False, preview_segments=PREVIEW_SEGMENTS,
+                 preview_duration=PREVIEW_DURATION, preview_sr=PREVIEW_SR, profiler=None, audio_store=None,
+                 loudness='cqt', spectrogram_store=None, duplicates=None, decoder=None):
         """
         initialize the instance
         :param song_path:
+        :param cache: (FeatureCache) a persistent feature cache, extracted features are read from and stored in it
+        :param streaming: (bool) if True, the song is decoded and analysed block by block with a bounded memory
+                          (see StreamingFeatureExtractor)
+        :param preview: (bool) if True, the features are extracted from a few excerpts of the song only, a fast tier
+                        for triage (see SongFeatureExtractor.preview_accuracy_report for its drift)
+        :param preview_segments: (int) number of excerpts decoded in the preview tier
+        :param preview_duration: (float) length (in seconds) of every excerpt
+        :param preview_sr: (int) the sampling rate the excerpts are decoded at
+        :param profiler: (PipelineProfiler) records every stage of the extraction, None for no profiling
+        :param audio_store: (DecodedAudioStore) the song is decoded once into this store and memory-mapped from it
+                            afterwards, None for always decoding
+        :param loudness: (str) the backend of the volume features, one of LOUDNESS_BACKENDS (see loudness_features).
+                         the streaming mode always uses the CQT
+        :param spectrogram_store: (SpectrogramStore) the analysis core of the song is written to this store (not in
+                                  the streaming or preview modes)
+        :param duplicates: (DuplicateIndex) the features of a near-duplicate of the song are taken from this index,
+                           and the extracted features are added to it
+        :param decoder: (AudioDecoder) the decoding backend and resampling mode of the song, None for librosa.load
         """
         self.__audio_path = song_path
+        self.__cache = cache
+        self.__streaming = streaming and not preview
+        self.__profiler = profiler
+        self.__loudness = loudness
         self.__hop_length = 512
+        self.__engine = feature_engine(hop_length=self.__hop_length, loudness=loudness)
+        # the excerpts of the preview tier are not the spectrogram of the song
+        self.__spectrogram_store = None if preview else spectrogram_store
+        self.__duplicates = duplicates
         self.__features = {}
         self.keys = ['C', 'C#', 'D', 'D#', 'E', 'F', 'F#', 'G', 'G#', 'A', 'A#', 'B']
 
+    @classmethod
+    def from_array(cls, y, sr):
+        """
+        create an extractor over an audio time series that is already decoded in memory
+        :param y: (np array) the audio time series, mono or with the channels first (channels x frames). integer PCM
+                  is scaled to [-1, 1]
+        :param sr: (int) sampling rate of the audio
+        :return: an instance of this class, the audio is converted as librosa.load would (mono, 22050 Hz)
+        :raise: ValueError if the audio is frames first (frames x channels)
+        """
+        instance = super(SingleAudioFeatureExtractor, cls).__new__(cls)
+        instance.__init__(None)
+        instance.__cached_features = None
+        instance.__fingerprint = None
+        instance.__audio_time_series, instance.__sampling_rate = as_librosa_audio(y, sr)
+        return instance
+
+    @classmethod
+    def from_buffer(cls, buffer, cache=None):
+        """
+        create an extractor over encoded audio held in memory (the content of an audio file), without writing it to
+        disk
+        :param buffer: (bytes, memoryview) the encoded audio
+        :param cache: (FeatureCache) a persistent feature cache, a buffer has the cache key of a file with its content
+                      decoded the same way (formats piped through ffmpeg are keyed as the ffmpeg decoder)
+        :return: an instance of this class
+        :raise: ValueError if the buffer is an mp4/m4a whose index follows its audio (see decode_buffer)
+        """
+        instance = super(SingleAudioFeatureExtractor, cls).__new__(cls)
+        instance.__init__(None, cache=cache)
+        instance.__cached_features = None
+        instance.__fingerprint = None
+        instance.__variant = cache_variant(decoder=buffer_decoder(buffer))
+        if cache is not None:
+            instance.__cache_key = cache.buffer_key(buffer, variant=instance.__variant)
+            instance.__cached_features = cache.get(instance.__cache_key)
+        if instance.__cached_features is None:
+            instance.__audio_time_series, instance.__sampling_rate = decode_buffer(buffer)
+        return instance
+
     def __repr__(self):
         frame = '='*50
         labels = list(self.__features.keys())
@@ -202,70 +920,332 @@ class SingleAudioFeatureExtractor:
                     mean_fit_coefficient(const), mean_fit_coefficient(linear), mean_fit_coefficient(quadratic),
                     mean_flatness, mean_harmonic_flatness]
         """
-        self.__beat_features()
-        self.__volume_features()
-        self.__zcr()
-        self.__poly_features()
-        self.__flatness()
+        if self.__cached_features is not None:
+            self.__features = dict(self.__cached_features)
+            return np.array(list(self.__features.values()))
+        if self.__streaming:
+            with self.__stage('streaming'):
+                self.__features = StreamingFeatureExtractor(hop_length=self.__hop_length).extract(self.__audio_path)
+        else:
+            self.__features = self.__engine.features(self.__audio_time_series, self.__sampling_rate, self.__stage,
+                                                     self.__spectrogram_store, self.__audio_path)
+        if self.__cache is not None:
+            self.__cache.put(self.__cache_key, self.__features)
+        if self.__duplicates is not None and self.__fingerprint is not None:
+            self.__duplicates.add(self.__audio_path, self.__fingerprint,
+                                  {label: float(value) for label, value in self.__features.items()}, self.__variant)
         return np.array(list(self.__features.values()))
 
-    def __beat_features(self):
+    def __stage(self, stage):
         """
-        add the beat features to the features dict
+        a context recording a stage of the extraction with the profiler of the instance (if it has one)
+        :param stage: (str) the name of the stage
+        :return: a context manager
         """
-        y_harmonic, y_percussive = librosa.effects.hpss(self.__audio_time_series)
-        self.__harmonic_time_series = y_harmonic
-        tempo, beat_frames = librosa.beat.beat_track(y=y_percussive, sr=self.__sampling_rate)
-        beat_times = librosa.frames_to_time(frames=beat_frames, sr=self.__sampling_rate)
-        self.__features['tempo'] = tempo
-        self.__features['first_beat'] = beat_times[0]
+        return profile_stage(self.__profiler, self.__audio_path, stage)
 
-    def __volume_features(self):
-        """
-        add the volume features to the features dict
-        """
-        fmin = librosa.note_to_hz('A1')
-        c = np.abs(librosa.cqt(self.__audio_time_series, sr=self.__sampling_rate, fmin=fmin))
-        # amplitude_to_decibels = librosa.amplitude_to_db(c, ref=np.max)
-        # max_volume_decibels = np.max(amplitude_to_decibels)
-        # self.__features['max_volume(dB)'] = max_volume_decibels
-        # volume_sd_decibels = np.std(amplitude_to_decibels)
-        # self.__features['volume_sd(dB)'] = volume_sd_decibels
-        freqs = librosa.cqt_frequencies(c.shape[0], fmin=fmin)
-        perceptual_cqt = librosa.perceptual_weighting(c**2, freqs, ref=np.max)
-        # max_volume_pw = np.max(perceptual_cqt)
-        self.__features['max_volume(PW)'] = np.max(perceptual_cqt)
-        # volume_sd_pw = np.std(perceptual_cqt)
-        self.__features['volume_sd(PW)'] = np.std(perceptual_cqt)
 
-    def __zcr(self):
-        """
-        add the zero crossing rate to the features dict
-        """
-        zcr = librosa.feature.zero_crossing_rate(self.__audio_time_series, frame_length=self.__audio_time_series.shape[0],
-                                                 hop_length=self.__audio_time_series.shape[0] + 1)
-        # zc = np.nonzero(librosa.zero_crossings(self.__audio_time_series))[0]
-        # self.__features['zero_crossing'] = len(zc)
-        self.__features['zcr'] = zcr[0][0]
+def loudness_features(y, sr, backend='cqt', analysis=None, hop_length=512):
+    """
+    compute the volume features: the max and std of the perceptually weighted power (in dB relative to its maximum)
+    over log-spaced frequency bins from A1
+    :param y: (np array) the audio time series
+    :param sr: (int) sampling rate of the audio
+    :param backend: (str) how the power of the bins is computed, one of LOUDNESS_BACKENDS:
+                    'cqt' - a full CQT (the reference),
+                    'cqt_decimated' - a CQT with a 4 times larger hop, so a quarter of the frames,
+                    'stft' - interpolated from the STFT magnitude of the analysis core, no extra transform at all
+    :param analysis: (SpectralAnalysis) the analysis core of the audio time series, for the 'stft' backend (computed
+                     if not given)
+    :param hop_length: (int) number of samples between successive frames
+    :return: (float, float) the max and the std of the perceptually weighted power
+    :raise: ValueError if the backend is unknown
+    """
+    return feature_engine(analysis.n_fft if analysis is not None else 2048, hop_length,
+                          backend).volume_features(y, sr, analysis)
 
-    def __poly_features(self):
-        """
-        add the polynomial fitting coefficients to the features dict
-        """
-        s = np.abs(librosa.stft(self.__audio_time_series))
-        p2 = librosa.feature.poly_features(S=s, order=2)
-        self.__features['mean_fit_coefficient0'] = np.mean(p2[2])
-        self.__features['mean_fit_coefficient1'] = np.mean(p2[1])
-        self.__features['mean_fit_coefficient2'] = np.mean(p2[0])
 
-    def __flatness(self):
-        """
-        add the flatness features to features dict
-        """
-        flatness = librosa.feature.spectral_flatness(self.__audio_time_series)
-        harmonic_flatness = librosa.feature.spectral_flatness(self.__harmonic_time_series)
-        self.__features['mean_flatness'] = np.mean(flatness)
-        self.__features['mean_harmonic_flatness'] = np.mean(harmonic_flatness)
+def loudness_backend_report(song_paths, backends=('cqt_decimated', 'stft')):
+    """
+    compare the runtime and the error of the fast loudness backends against the full CQT on a set of songs
+    :param song_paths: the paths to the audio files
+    :param backends: the backends to compare (see loudness_features)
+    :return: (pandas DataFrame) a row per backend: its total runtime, the total runtime of the CQT, the speedup, and the
+             mean and max absolute error of max_volume(PW) and volume_sd(PW)
+    """
+    rows = []
+    for song in song_paths:
+        y, sr = librosa.load(song)
+        # the STFT is shared with the other features in the extraction, so it is not part of the backend runtime
+        analysis = SpectralAnalysis(y, sr)
+        start = time.perf_counter()
+        reference = loudness_features(y, sr, 'cqt')
+        cqt_time = time.perf_counter() - start
+        for backend in backends:
+            start = time.perf_counter()
+            max_volume, volume_sd = loudness_features(y, sr, backend, analysis)
+            rows.append({'backend': backend, 'time': time.perf_counter() - start, 'cqt_time': cqt_time,
+                         'max_volume_error': abs(max_volume - reference[0]),
+                         'volume_sd_error': abs(volume_sd - reference[1])})
+    report = pd.DataFrame(rows).groupby('backend').agg({'time': 'sum', 'cqt_time': 'sum',
+                                                        'max_volume_error': ['mean', 'max'],
+                                                        'volume_sd_error': ['mean', 'max']})
+    report.columns = ['time', 'cqt_time', 'max_volume_mean_error', 'max_volume_max_error',
+                      'volume_sd_mean_error', 'volume_sd_max_error']
+    report.insert(2, 'speedup', report['cqt_time'] / report['time'])
+    return report
+
+
+@lru_cache(maxsize=None)
+def feature_engine(n_fft=2048, hop_length=512, loudness='cqt'):
+    """
+    the feature engine of a configuration, shared by all the extractors of the process so its bases are built once
+    :param n_fft: (int) the FFT window size
+    :param hop_length: (int) number of samples between successive frames
+    :param loudness: (str) the backend of the volume features
+    :return: (FeatureEngine) the engine
+    :raise: ValueError if the loudness backend is unknown
+    """
+    return FeatureEngine(n_fft, hop_length, loudness)
+
+
+def cache_variant(streaming=False, loudness='cqt', decoder=None):
+    """
+    the cache key variant of the extraction options that change the feature values
+    :param streaming: (bool) the streaming mode (which always uses the CQT and decodes with librosa.stream)
+    :param loudness: (str) the backend of the volume features
+    :param decoder: (AudioDecoder) the decoder of the audio, None for librosa.load
+    :return: (str) the variant (see FeatureCache.key)
+    """
+    if streaming:
+        return 'streaming'
+    variants = []
+    if loudness != 'cqt':
+        variants.append('loudness={0}'.format(loudness))
+    if decoder is not None and decoder.variant:
+        variants.append(decoder.variant)
+    return ','.join(variants)
+
+
+def scan_audio_files(dir_path, file_types, recursive=True):
+    """
+    walk a directory lazily (with os.scandir) and generate the paths of its audio files
+    :param dir_path: the path to the directory
+    :param file_types: the extensions of audio files (lower case, without the dot)
+    :param recursive: (bool) if True, the nested directories are walked as well
+    :return: a generator of the paths to the audio files
+    """
+    directories = [dir_path]
+    # symlinked directories are followed, but every directory is walked once (a symlink loop would never end)
+    visited = set()
+    while directories:
+        directory = directories.pop()
+        stat = os.stat(directory)
+        if (stat.st_dev, stat.st_ino) in visited:
+            continue
+        visited.add((stat.st_dev, stat.st_ino))
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    if recursive:
+                        directories.append(entry.path)
+                elif entry.is_file() and entry.name.split('.')[-1].lower() in file_types:
+                    yield entry.path
+
+
+def as_librosa_audio(y, sr, target_sr=22050):
+    """
+    convert an audio time series to the form librosa.load returns (float32, mono, resampled)
+    :param y: (np array) the audio time series, mono or with the channels first (channels x frames, as librosa)
+    :param sr: (int) sampling rate of the audio
+    :param target_sr: (int) the sampling rate to resample to
+    :return: (np array, int) the converted audio time series and its sampling rate
+    :raise: ValueError if the audio has more channels than frames (frames first, as soundfile reads it, transpose it)
+    """
+    y = np.asarray(y)
+    if y.ndim == 2 and y.shape[0] > y.shape[1]:
+        raise ValueError('expected the channels first (channels x frames), got an audio of shape {0}, transpose '
+                         'it'.format(y.shape))
+    if np.issubdtype(y.dtype, np.integer):
+        y = librosa.util.buf_to_float(y, n_bytes=y.dtype.itemsize)
+    y = y.astype(np.float32)
+    if y.ndim > 1:
+        y = librosa.to_mono(y)
+    if sr != target_sr:
+        y = librosa.resample(y, orig_sr=sr, target_sr=target_sr)
+    return y, target_sr
+
+
+def buffer_decoder(buffer):
+    """
+    :param buffer: (bytes, memoryview) the encoded audio
+    :return: (AudioDecoder) the decoding of the buffer by decode_buffer, None for the formats soundfile reads (decoded
+             as librosa.load would), the ffmpeg decoder for the others
+    """
+    try:
+        soundfile.info(io.BytesIO(buffer))
+    except RuntimeError:
+        return AudioDecoder('ffmpeg')
+    return None
+
+
+def mp4_index_at_end(buffer):
+    """
+    check whether an mp4/m4a file has its index (the moov atom) after its audio (the mdat atom), which ffmpeg can not
+    read from a pipe
+    :param buffer: (bytes, memoryview) the encoded audio
+    :return: (bool) True for an mp4 whose mdat atom comes before its moov atom
+    """
+    buffer = memoryview(buffer)
+    offset = 0
+    while offset + 8 <= len(buffer):
+        size = int.from_bytes(buffer[offset:offset + 4], 'big')
+        atom = buffer[offset + 4:offset + 8].tobytes()
+        if atom == b'moov':
+            return False
+        if atom == b'mdat':
+            return True
+        if size == 1:
+            size = int.from_bytes(buffer[offset + 8:offset + 16], 'big')
+        if size < 8:
+            return False
+        offset += size
+    return False
+
+
+def decode_buffer(buffer, sr=22050):
+    """
+    decode encoded audio held in memory, without a temporary file. formats readable by soundfile (wav, flac, ogg, and
+    mp3 with libsndfile 1.1+) are decoded in process, the others (m4a...) are piped through ffmpeg (see
+    buffer_decoder).
+    ffmpeg can not seek in a pipe, so an m4a whose index is stored after its audio (common for files that were not
+    'fast started') can not be decoded from memory, it must be decoded from a file
+    :param buffer: (bytes, memoryview) the encoded audio
+    :param sr: (int) the sampling rate to decode to
+    :return: (np array, int) the mono audio time series and its sampling rate
+    :raise: ValueError if the buffer is an mp4/m4a whose index follows its audio
+    :raise: subprocess.CalledProcessError if ffmpeg could not decode the buffer
+    """
+    try:
+        y, native_sr = soundfile.read(io.BytesIO(buffer), dtype='float32', always_2d=True)
+    except RuntimeError:
+        if bytes(buffer[4:8]) == b'ftyp' and mp4_index_at_end(buffer):
+            raise ValueError('the mp4/m4a index (moov atom) follows the audio, it can not be decoded from memory, '
+                             'decode it from a file instead')
+        command = ['ffmpeg', '-v', 'quiet', '-i', 'pipe:0', '-f', 'f32le', '-ac', '1', '-ar', str(sr), 'pipe:1']
+        decoded = subprocess.run(command, input=buffer, stdout=subprocess.PIPE, check=True).stdout
+        return np.frombuffer(decoded, dtype=np.float32), sr
+    return as_librosa_audio(y.T, native_sr, sr)
+
+
+def cqt_bins(sr, fmin, n_bins=84):
+    """
+    the number of CQT bins (up to the default 84 = 7 octaves) whose filters lie below the Nyquist frequency, so the
+    volume features can be computed at reduced sampling rates
+    :param sr: (int) sampling rate of the audio
+    :param fmin: (float) the frequency of the lowest bin
+    :param n_bins: (int) the maximal number of bins
+    :return: (int) the number of bins
+    """
+    return min(n_bins, int(12 * np.log2(sr / 2.0 / (fmin * 1.05))))
+
+
+def load_audio(song_path, audio_store=None, sr=22050, decoder=None):
+    """
+    decode a song, through the decoded audio store if one is given
+    :param song_path: the path to the audio file
+    :param audio_store: (DecodedAudioStore) the store the decoded song is memory-mapped from, None for decoding
+    :param sr: (int) the sampling rate to decode to
+    :param decoder: (AudioDecoder) the decoding backend, None for librosa.load
+    :return: (np array, int) the audio time series and its sampling rate
+    """
+    if audio_store is None:
+        if decoder is None:
+            return librosa.load(song_path, sr=sr)
+        return decoder.load(song_path, sr=sr)
+    return audio_store.load(song_path, sr=sr, decoder=decoder)
+
+
+def load_excerpts(song_path, segments=PREVIEW_SEGMENTS, duration=PREVIEW_DURATION, sr=PREVIEW_SR, audio_store=None,
+                  decoder=None):
+    """
+    decode only a few evenly spread excerpts of a song (the first one at its start, so the first beat is kept)
+    :param song_path: the path to the audio file
+    :param segments: (int) number of excerpts
+    :param duration: (float) length (in seconds) of every excerpt
+    :param sr: (int) the sampling rate the excerpts are decoded at
+    :param audio_store: (DecodedAudioStore) if given, the excerpts are sliced from the whole song stored (at the
+                        reduced sampling rate) in it
+    :param decoder: (AudioDecoder) the decoding backend, None for librosa.load
+    :return: (np array, int) the concatenated excerpts and their sampling rate
+    """
+    if audio_store is not None:
+        y, sr = audio_store.load(song_path, sr=sr, decoder=decoder)
+        length = int(duration * sr)
+        if len(y) <= segments * length:
+            return np.array(y), sr
+        return np.concatenate([y[start:start + length]
+                               for start in np.linspace(0, len(y) - length, segments).astype(int)]), sr
+    if decoder is None:
+        decoder = AudioDecoder()
+    total_duration = decoder.get_duration(song_path)
+    if total_duration <= segments * duration:
+        return decoder.load(song_path, sr=sr)
+    excerpts = [decoder.load(song_path, sr=sr, offset=offset, duration=duration)[0]
+                for offset in np.linspace(0, total_duration - duration, segments)]
+    return np.concatenate(excerpts), sr
+
+
+def song_features_or_none(song_path, cache=None, streaming=False, profiler=None, audio_store=None, loudness='cqt',
+                          spectrogram_store=None, duplicates=None, decoder=None):
+    """
+    extract the features of a single song, isolating any failure of it (used by the worker processes)
+    :param song_path: the path to the audio file
+    :param cache: (FeatureCache) a persistent feature cache, None for always extracting
+    :param streaming: (bool) if True, the song is decoded and analysed block by block
+    :param profiler: (PipelineProfiler) records every stage of the extraction, None for no profiling
+    :param audio_store: (DecodedAudioStore) the store the decoded song is memory-mapped from, None for decoding
+    :param loudness: (str) the backend of the volume features
+    :param spectrogram_store: (SpectrogramStore) the analysis core of the song is written to this store
+    :param duplicates: (DuplicateIndex) the features of a near-duplicate of the song are taken from this index
+    :param decoder: (AudioDecoder) the decoding backend, None for librosa.load
+    :return: (dict) the features of the song (keys = feature labels, values = feature values), None if the song
+             could not be loaded or analysed
+    """
+    try:
+        extractor = SingleAudioFeatureExtractor(song_path, cache=cache, streaming=streaming, profiler=profiler,
+                                                audio_store=audio_store, loudness=loudness,
+                                                spectrogram_store=spectrogram_store, duplicates=duplicates,
+                                                decoder=decoder)
+        if extractor is None:
+            return None
+        extractor.extract_features()
+        return extractor.get_feature_dict()
+    except Exception:
+        return None
+
+
+def profiled_song_features(song_path, profiler, cache=None, streaming=False, audio_store=None, loudness='cqt',
+                           spectrogram_store=None, duplicates=None, decoder=None):
+    """
+    extract the features of a single song in a worker process, profiling its stages
+    :param song_path: the path to the audio file
+    :param profiler: (PipelineProfiler) the profiler of the caller, a copy of it without records runs in the worker
+    :param cache: (FeatureCache) a persistent feature cache, None for always extracting
+    :param streaming: (bool) if True, the song is decoded and analysed block by block
+    :param audio_store: (DecodedAudioStore) the store the decoded song is memory-mapped from, None for decoding
+    :param loudness: (str) the backend of the volume features
+    :param spectrogram_store: (SpectrogramStore) the analysis core of the song is written to this store
+    :param duplicates: (DuplicateIndex) the features of a near-duplicate of the song are taken from this index
+    :param decoder: (AudioDecoder) the decoding backend, None for librosa.load
+    :return: (dict, list) the features of the song (None if it could not be processed), and the records of its stages
+    """
+    song_features = song_features_or_none(song_path, cache=cache, streaming=streaming, profiler=profiler,
+                                          audio_store=audio_store, loudness=loudness,
+                                          spectrogram_store=spectrogram_store, duplicates=duplicates,
+                                          decoder=decoder)
+    profiler.close()
+    return song_features, profiler.records
 
 
 # wav = '.wav'
@@ -0,0 +1,142 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def spelling_correction(spell, word, max_distance=2):
+    """
+    the most frequent known word within an edit distance of a word (as SpellChecker.correction)
+    :param spell: the SpellChecker
+    :param word: (str) the word to correct
+    :param max_distance: (int) the maximal edit distance of the candidates, 1 or 2
+    :return: (str) the correction, the word itself if there is no candidate
+    """
+    if max_distance >= 2:
+        return spell.correction(word)
+    candidates = spell.known([word]) or spell.known(spell.edit_distance_1(word))
+    if not candidates:
+        return word
+    return max(candidates, key=lambda candidate: spell[candidate])
+
+
+class CorrectionCache:
+    """
+    A memo of spelling corrections, shared by all the songs (lyrics slang repeats in nearly every song, and every
+    correction is an edit distance search over the whole dictionary).
+    the most recently used corrections are kept in memory, bounded by a number of words. with a db_path they are also
+    stored in a local SQLite file, and reused by the next runs
+    """
+    def __init__(self, db_path=None, max_size=100000, long_word=None):
+        """
+        initializing the cache, creating the SQLite file if it does not exist
+        :param db_path: the path to the SQLite file of the cache, None to keep the corrections in memory only
+        :param max_size: (int) the maximal number of corrections kept (in memory and in the SQLite file)
+        :param long_word: (int) words of at least this length are only corrected within an edit distance of 1 (their
+                          distance 2 search is the slowest), None to search distance 2 for every word
+        """
+        self.db_path = db_path
+        self.max_size = max_size
+        self.long_word = long_word
+        self.__corrections = OrderedDict()
+        self.__loaded = db_path is None
+        self.__lock = threading.Lock()
+        if db_path is not None:
+            db_dir = os.path.dirname(db_path)
+            if db_dir and not os.path.isdir(db_dir):
+                os.makedirs(db_dir)
+            with self.__connect() as conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS corrections (word TEXT NOT NULL, distance INTEGER NOT NULL, '
+                             'correction TEXT, last_access REAL NOT NULL, PRIMARY KEY (word, distance))')
+                conn.execute('CREATE INDEX IF NOT EXISTS corrections_last_access ON corrections (last_access)')
+
+    def __getstate__(self):
+        """
+        the cache is sent to worker processes without the corrections read so far (and without its lock)
+        """
+        state = self.__dict__.copy()
+        state['_CorrectionCache__corrections'] = OrderedDict()
+        state['_CorrectionCache__loaded'] = self.db_path is None
+        del state['_CorrectionCache__lock']
+        return state
+
+    def __setstate__(self, state):
+        """
+        the cache is received in a worker process, with a new lock
+        """
+        self.__dict__.update(state)
+        self.__lock = threading.Lock()
+
+    def __connect(self):
+        """
+        open a connection to the SQLite file. a connection is opened per operation so the cache can be shared
+        (and pickled) between processes
+        :return: a sqlite3 connection
+        """
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def distance(self, word):
+        """
+        :param word: (str) a word
+        :return: (int) the maximal edit distance of the corrections of the word
+        """
+        return 1 if self.long_word is not None and len(word) >= self.long_word else 2
+
+    def correct(self, spell, words):
+        """
+        correct words, searching only the ones whose correction is not cached
+        :param spell: the SpellChecker
+        :param words: the (unknown) words to correct
+        :return: (dict) key = word, value = its correction
+        """
+        self.__load()
+        corrections = dict()
+        missing = []
+        with self.__lock:
+            for word in words:
+                if word in self.__corrections:
+                    self.__corrections.move_to_end(word)
+                    corrections[word] = self.__corrections[word]
+                else:
+                    missing.append(word)
+        computed = {word: spelling_correction(spell, word, self.distance(word)) for word in missing}
+        corrections.update(computed)
+        with self.__lock:
+            self.__corrections.update(computed)
+            while len(self.__corrections) > self.max_size:
+                self.__corrections.popitem(last=False)
+        if self.db_path is not None and corrections:
+            self.__store(corrections)
+        return corrections
+
+    def __load(self):
+        """
+        read the most recently used corrections from the SQLite file, once
+        """
+        if self.__loaded:
+            return
+        with self.__connect() as conn:
+            rows = conn.execute('SELECT word, distance, correction FROM corrections ORDER BY last_access DESC LIMIT ?',
+                                (self.max_size,)).fetchall()
+        with self.__lock:
+            for word, distance, correction in reversed(rows):
+                if distance == self.distance(word) and word not in self.__corrections:
+                    self.__corrections[word] = correction
+            self.__loaded = True
+
+    def __store(self, corrections):
+        """
+        store corrections in the SQLite file (marking them as recently used), evicting the least recently used ones
+        if the file exceeds its size
+        :param corrections: (dict) key = word, value = its correction
+        """
+        now = time.time()
+        with self.__connect() as conn:
+            conn.executemany('INSERT OR REPLACE INTO corrections (word, distance, correction, last_access) '
+                             'VALUES (?, ?, ?, ?)',
+                             [(word, self.distance(word), correction, now) for word, correction in corrections.items()])
+            excess = conn.execute('SELECT COUNT(*) FROM corrections').fetchone()[0] - self.max_size
+            if excess > 0:
+                conn.execute('DELETE FROM corrections WHERE rowid IN '
+                             '(SELECT rowid FROM corrections ORDER BY last_access LIMIT ?)', (excess,))
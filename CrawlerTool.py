@@ -1,7 +1,6 @@
 import json
 import pandas as pd
 from ViewsCrawler import ViewsCrawler as vc
-from textFeatureExtraction import TextFeatureExtractor
 import os
 
 class CrawlerTool:
@@ -10,29 +9,35 @@ class CrawlerTool:
         self.vc = vc()
 
 
-    def processMultiDirectories(self,directory):
+    def processMultiDirectories(self,directory,concurrency=1,host_concurrency=None,host_delay=0.0):
         '''
         will iterate over a directory that has directories with songs
         :param directory: a directory with directories with songs
+        :param concurrency: the number of songs crawled at once (see ViewsCrawler.processDirectory)
+        :param host_concurrency: the maximal number of requests in flight to the same host, None for concurrency
+        :param host_delay: the minimal time (in seconds) between two requests to the same host
         :return: prints resalts
         '''
         for filename in os.listdir(directory):
             path = os.path.join(directory, filename)
             if os.path.isdir(path):
-                self.processSingleDirectory(path)
+                self.processSingleDirectory(path, concurrency, host_concurrency, host_delay)
 
-    def processSingleDirectory(self,directory):
+    def processSingleDirectory(self,directory,concurrency=1,host_concurrency=None,host_delay=0.0):
         '''
         iterates over all of the songs in a directory, retrievs data from you tube and lyrics features, saves them to a
         json file and a csv file in thislocal path
         :param directory: a directory with songs
+        :param concurrency: the number of songs crawled at once (see ViewsCrawler.processDirectory)
+        :param host_concurrency: the maximal number of requests in flight to the same host, None for concurrency
+        :param host_delay: the minimal time (in seconds) between two requests to the same host
         :return: prints resalts
         '''
 
         dataFile = directory.split('/')[-1] + ".json"
         print("******************************************************************************\nworking on -->" + dataFile)
         print('retrieving data from youtube:')
-        self.vc.processDirectory(directory, dataFile, False)
+        self.vc.processDirectory(directory, dataFile, False, concurrency, host_concurrency, host_delay)
         print("\nCreating SCV file: " + dataFile, end='')
         self.jsonToCSV(dataFile)
         print(' ----> Done!')
@@ -92,8 +97,7 @@ class CrawlerTool:
             if youtube_data is None:
                 return None
             lyrics = self.vc.getLyrics(songName,artist)
-            tfe = TextFeatureExtractor()
-            features = tfe.extract(lyrics)
+            features = self.vc.getFeatures(lyrics)
             return {'numberOfViews': youtube_data['NUMBER_OF_VIEWS'],
                     'features': features, 'youTube_title': youtube_data['TITLE'], 'lyrics': lyrics}
         except:
@@ -0,0 +1,58 @@
+import os
+import numpy as np
+import librosa
+from FeatureCache import content_hash
+
+
+class DecodedAudioStore:
+    """
+    An on-disk store of decoded audio.
+    every track is decoded once and written as a raw float32 '.npy' file, keyed by the hash of its content and the
+    sampling rate. later runs memory-map the stored file instead of decoding the track again
+    """
+    def __init__(self, store_dir='ExtractedData/decoded_audio'):
+        """
+        initializing the store, creating its directory if it does not exist
+        :param store_dir: the directory the decoded tracks are stored in
+        """
+        self.store_dir = store_dir
+        if not os.path.isdir(store_dir):
+            os.makedirs(store_dir)
+
+    def path(self, song_path, sr=22050, decoder=None):
+        """
+        the path of the stored decoded track
+        :param song_path: the path to the audio file
+        :param sr: (int) the sampling rate of the decoded track
+        :param decoder: (AudioDecoder) the decoder of the track, None for librosa.load
+        :return: the path to the '.npy' file (that may not exist yet)
+        :raise: FileNotFoundError if the audio file does not exist
+        """
+        suffix = ''
+        if decoder is not None and decoder.variant:
+            suffix = '_{0}_{1}'.format(decoder.backend, decoder.res_type)
+        return os.path.join(self.store_dir, '{0}_{1}{2}.npy'.format(content_hash(song_path), sr, suffix))
+
+    def load(self, song_path, sr=22050, decoder=None):
+        """
+        load a track as librosa.load would (mono, resampled), memory-mapped from the store. a track that is not stored
+        yet is decoded and stored
+        :param song_path: the path to the audio file
+        :param sr: (int) the sampling rate to decode to
+        :param decoder: (AudioDecoder) the decoder of a track that is not stored yet, None for librosa.load
+        :return: (np array, int) the (read only) audio time series and its sampling rate
+        :raise: FileNotFoundError if the audio file does not exist
+        """
+        stored_path = self.path(song_path, sr, decoder)
+        if os.path.isfile(stored_path):
+            return np.load(stored_path, mmap_mode='r'), sr
+        if decoder is None:
+            y, sr = librosa.load(song_path, sr=sr)
+        else:
+            y, sr = decoder.load(song_path, sr=sr)
+        # written under a temporary name first, so other processes never map a partially written file
+        temp_path = '{0}.{1}.tmp'.format(stored_path, os.getpid())
+        with open(temp_path, 'wb') as stored_file:
+            np.save(stored_file, y.astype(np.float32))
+        os.replace(temp_path, stored_path)
+        return y, sr
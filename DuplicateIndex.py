@@ -0,0 +1,174 @@
+import json
+import os
+import sqlite3
+import threading
+import numpy as np
+import librosa
+
+# the number of set bits of every byte value
+POPCOUNT = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8)
+
+
+def audio_fingerprint(song_path, offset=30.0, duration=10.0, sr=11025, n_fft=4096, hop_length=256):
+    """
+    compute a compact fingerprint of a short excerpt of a song. every frame gets 32 bits: the signs of the energy
+    differences between neighbouring bands (33 mel bands of 300-2000 Hz) and successive frames. the bits survive
+    re-encoding, resampling, noise and volume changes, so re-uploads of a recording get nearly the same fingerprint
+    :param song_path: the path to the audio file
+    :param offset: (float) the start (in seconds) of the excerpt, moved back for songs too short for it
+    :param duration: (float) the length (in seconds) of the excerpt
+    :param sr: (int) the sampling rate the excerpt is decoded at
+    :param n_fft: (int) the frame size, long frames with a small hop keep the bits stable under misalignment
+    :param hop_length: (int) number of samples between successive frames
+    :return: (np array, float) the fingerprint (uint32 per frame) and the duration of the song in seconds
+    :raise: FileNotFoundError if the audio file does not exist
+    """
+    if not os.path.isfile(song_path):
+        raise FileNotFoundError(song_path)
+    total_duration = librosa.get_duration(filename=song_path)
+    y, sr = librosa.load(song_path, sr=sr, offset=max(0.0, min(offset, total_duration - duration)),
+                         duration=duration)
+    mel = librosa.feature.melspectrogram(y=y, sr=sr, n_fft=n_fft, hop_length=hop_length, n_mels=33,
+                                         fmin=300.0, fmax=2000.0)
+    band_difference = np.diff(np.log(mel + 1e-10), axis=0)
+    bits = np.diff(band_difference, axis=1) > 0
+    fingerprint = np.ascontiguousarray(np.packbits(bits.T, axis=1)).view('>u4').ravel().astype(np.uint32)
+    return fingerprint, total_duration
+
+
+def bit_error_rate(query, candidate, max_shift):
+    """
+    the ratio of differing bits between two fingerprints, at their best alignment
+    :param query: (np array) a fingerprint
+    :param candidate: (np array) another fingerprint
+    :param max_shift: (int) the maximal shift (in frames) between the fingerprints
+    :return: (float) the minimal bit error rate over the shifts, 1 if the fingerprints are too short to be compared
+    """
+    core = query[max_shift:len(query) - max_shift]
+    shifts = len(candidate) - len(core) + 1
+    if len(core) == 0 or shifts <= 0:
+        return 1.0
+    windows = np.lib.stride_tricks.as_strided(candidate, shape=(shifts, len(core)),
+                                              strides=(candidate.strides[0], candidate.strides[0]))
+    errors = POPCOUNT[np.bitwise_xor(windows, core).view(np.uint8)].reshape(shifts, -1).sum(axis=1)
+    return np.min(errors) / (32.0 * len(core))
+
+
+class DuplicateIndex:
+    """
+    An index of the songs already extracted, that recognizes near-duplicate recordings (the same song re-uploaded under
+    another file name, re-encoded or with another bit rate).
+    every song is stored with the fingerprint of a short excerpt and its extracted record, in a local SQLite file. a
+    new song whose fingerprint is close enough to a stored one (see bit_error_rate) reuses that record instead of being
+    extracted again
+    """
+    def __init__(self, db_path='ExtractedData/duplicate_index.sqlite', threshold=0.35, max_shift=2.0,
+                 duration_tolerance=10.0, fingerprint_kwargs=None):
+        """
+        initializing the index, creating the SQLite file if it does not exist
+        :param db_path: the path to the SQLite file of the index
+        :param threshold: (float) the maximal bit error rate of a duplicate (unrelated songs are around 0.5)
+        :param max_shift: (float) the maximal misalignment (in seconds) between the excerpts of duplicates
+        :param duration_tolerance: (float) the maximal difference (in seconds) between the durations of duplicates
+        :param fingerprint_kwargs: (dict) the excerpt of the fingerprint (see audio_fingerprint)
+        """
+        self.db_path = db_path
+        self.threshold = threshold
+        self.duration_tolerance = duration_tolerance
+        self.fingerprint_kwargs = dict(fingerprint_kwargs or {})
+        frame_time = self.fingerprint_kwargs.get('hop_length', 256) / float(self.fingerprint_kwargs.get('sr', 11025))
+        self.max_shift = int(round(max_shift / frame_time))
+        self.__fingerprints = []
+        self.__last_row = 0
+        self.__lock = threading.Lock()
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.isdir(db_dir):
+            os.makedirs(db_dir)
+        with self.__connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS songs '
+                         '(id INTEGER PRIMARY KEY, song TEXT NOT NULL, variant TEXT NOT NULL, duration REAL NOT NULL, '
+                         'fingerprint BLOB NOT NULL, record TEXT NOT NULL)')
+
+    def __getstate__(self):
+        """
+        the index is sent to worker processes without the fingerprints read so far (and without its lock)
+        """
+        state = self.__dict__.copy()
+        state['_DuplicateIndex__fingerprints'] = []
+        state['_DuplicateIndex__last_row'] = 0
+        del state['_DuplicateIndex__lock']
+        return state
+
+    def __setstate__(self, state):
+        """
+        the index is received in a worker process, with a new lock
+        """
+        self.__dict__.update(state)
+        self.__lock = threading.Lock()
+
+    def __connect(self):
+        """
+        open a connection to the SQLite file. a connection is opened per operation so the index can be shared
+        (and pickled) between processes
+        :return: a sqlite3 connection
+        """
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def fingerprint(self, song_path):
+        """
+        :param song_path: the path to the audio file
+        :return: (np array, float) the fingerprint of the song and its duration (see audio_fingerprint)
+        :raise: FileNotFoundError if the audio file does not exist
+        """
+        return audio_fingerprint(song_path, **self.fingerprint_kwargs)
+
+    def find(self, fingerprint, variant=''):
+        """
+        find a stored duplicate of a song
+        :param fingerprint: (np array, float) the fingerprint of the song and its duration
+        :param variant: (str) the kind of record looked for (e.g. the extraction variant, see FeatureCache.key)
+        :return: (str, dict) the path of the closest duplicate and its record, (None, None) if there is none
+        """
+        query, duration = fingerprint
+        self.__refresh()
+        best_song, best_record, best_rate = None, None, self.threshold
+        with self.__lock:
+            fingerprints = list(self.__fingerprints)
+        for song, song_variant, song_duration, candidate, row in fingerprints:
+            if song_variant != variant or abs(song_duration - duration) > self.duration_tolerance:
+                continue
+            rate = bit_error_rate(query, candidate, self.max_shift)
+            if rate <= best_rate:
+                best_song, best_record, best_rate = song, row, rate
+        if best_record is None:
+            return None, None
+        with self.__connect() as conn:
+            record = conn.execute('SELECT record FROM songs WHERE id = ?', (best_record,)).fetchone()[0]
+        return best_song, json.loads(record)
+
+    def add(self, song_path, fingerprint, record, variant=''):
+        """
+        store a song with its record
+        :param song_path: the path to the audio file
+        :param fingerprint: (np array, float) the fingerprint of the song and its duration
+        :param record: (dict) the record of the song (JSON serializable, e.g. its features)
+        :param variant: (str) the kind of record (see DuplicateIndex.find)
+        """
+        query, duration = fingerprint
+        with self.__connect() as conn:
+            conn.execute('INSERT INTO songs (song, variant, duration, fingerprint, record) VALUES (?, ?, ?, ?, ?)',
+                         (song_path, variant, duration, query.astype('<u4').tobytes(), json.dumps(record)))
+
+    def __refresh(self):
+        """
+        read the fingerprints stored (by any process) since the last read
+        """
+        with self.__connect() as conn:
+            rows = conn.execute('SELECT id, song, variant, duration, fingerprint FROM songs WHERE id > ? ORDER BY id',
+                                (self.__last_row,)).fetchall()
+        with self.__lock:
+            for row, song, variant, duration, fingerprint in rows:
+                if row > self.__last_row:
+                    fingerprint = np.frombuffer(fingerprint, dtype='<u4').astype(np.uint32)
+                    self.__fingerprints.append((song, variant, duration, fingerprint, row))
+                    self.__last_row = row
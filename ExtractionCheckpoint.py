@@ -0,0 +1,80 @@
+import json
+import os
+import sqlite3
+from FeatureCache import content_hash
+
+
+class ExtractionCheckpoint:
+    """
+    A checkpoint of a directory extraction.
+    the features of every song are written to a local SQLite table as soon as the song is done, together with the
+    size and modification time (and optionally the content hash) of its file, and keyed by the extraction variant
+    (the streaming mode, loudness and decoding backends, as in FeatureCache). a restarted or repeated extraction
+    with the same variant skips the songs whose file has not changed since
+    """
+    def __init__(self, db_path, use_hash=False):
+        """
+        initializing the checkpoint, creating the SQLite file if it does not exist
+        :param db_path: the path to the SQLite file of the checkpoint
+        :param use_hash: (bool) if True, a file is considered unchanged by its content hash instead of its
+                         modification time (slower, but survives copying the library)
+        """
+        self.db_path = db_path
+        self.use_hash = use_hash
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.isdir(db_dir):
+            os.makedirs(db_dir)
+        with self.__connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS checkpoints '
+                         '(path TEXT NOT NULL, variant TEXT NOT NULL, size INTEGER NOT NULL, mtime INTEGER NOT NULL, '
+                         'hash TEXT, features TEXT NOT NULL, PRIMARY KEY (path, variant))')
+
+    def __connect(self):
+        """
+        open a connection to the SQLite file
+        :return: a sqlite3 connection
+        """
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def __signature(self, song_path):
+        """
+        the signature a file is compared by
+        :param song_path: the path to the audio file
+        :return: (str, int, int, str) the absolute path, size, modification time (ns) and content hash (None if
+                 the checkpoint does not use hashes) of the file
+        """
+        stat = os.stat(song_path)
+        file_hash = content_hash(song_path) if self.use_hash else None
+        return os.path.abspath(song_path), stat.st_size, stat.st_mtime_ns, file_hash
+
+    def get(self, song_path, variant=''):
+        """
+        get the checkpointed features of a song
+        :param song_path: the path to the audio file
+        :param variant: (str) the extraction variant the features were computed with (see cache_variant)
+        :return: (dict) the features (keys = feature labels, values = feature values), None if the song was not
+                 extracted yet with this variant or its file has changed since
+        """
+        path, size, mtime, file_hash = self.__signature(song_path)
+        with self.__connect() as conn:
+            row = conn.execute('SELECT size, mtime, hash, features FROM checkpoints WHERE path = ? AND variant = ?',
+                               (path, variant)).fetchone()
+        if row is None or row[0] != size:
+            return None
+        changed = row[2] != file_hash if self.use_hash else row[1] != mtime
+        if changed:
+            return None
+        return json.loads(row[3])
+
+    def put(self, song_path, features, variant=''):
+        """
+        checkpoint the features of a song, committing them immediately
+        :param song_path: the path to the audio file
+        :param features: (dict) the features (keys = feature labels, values = feature values)
+        :param variant: (str) the extraction variant the features were computed with (see cache_variant)
+        """
+        path, size, mtime, file_hash = self.__signature(song_path)
+        serialized = json.dumps({label: float(value) for label, value in features.items()})
+        with self.__connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO checkpoints (path, variant, size, mtime, hash, features) '
+                         'VALUES (?, ?, ?, ?, ?, ?)', (path, variant, size, mtime, file_hash, serialized))
@@ -0,0 +1,165 @@
+import contextlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import pandas as pd
+
+
+class ExtractionQueue:
+    """
+    A work queue of a directory extraction, shared by worker processes on any number of hosts.
+    the songs are kept in a SQLite table on the shared storage. a worker claims a song by taking a lease on it, renews
+    the lease while it is extracting, and writes the features back. the lease of a worker that crashed expires and the
+    song is claimed again by another worker. no broker is needed, only a filesystem with working file locks (SQLite
+    locking is not reliable on every network filesystem)
+    """
+    def __init__(self, db_path, lease_time=600.0, max_attempts=3):
+        """
+        initializing the queue, creating the SQLite file if it does not exist
+        :param db_path: the path to the SQLite file of the queue (on storage shared by all the workers)
+        :param lease_time: (float) number of seconds a claimed song is leased for before another worker may claim it
+        :param max_attempts: (int) number of times a song is claimed before it is given up on as failed
+        """
+        self.db_path = db_path
+        self.lease_time = lease_time
+        self.max_attempts = max_attempts
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.isdir(db_dir):
+            os.makedirs(db_dir)
+        with self.__connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS songs "
+                         "(song TEXT PRIMARY KEY, state TEXT NOT NULL DEFAULT 'pending', owner TEXT, "
+                         "lease_expires REAL, attempts INTEGER NOT NULL DEFAULT 0, features TEXT)")
+
+    def __connect(self):
+        """
+        open a connection to the SQLite file. a connection is opened per operation so the queue can be shared
+        (and pickled) between processes
+        :return: a sqlite3 connection
+        """
+        return sqlite3.connect(self.db_path, timeout=60)
+
+    @staticmethod
+    def worker_id():
+        """
+        :return: (str) the default identity of the calling worker, its host name and process id
+        """
+        return '{0}:{1}'.format(socket.gethostname(), os.getpid())
+
+    def add(self, songs):
+        """
+        add songs to the queue, the songs that are already in it are kept as they are
+        :param songs: the songs (their paths relative to the extracted directory)
+        """
+        with self.__connect() as conn:
+            conn.executemany('INSERT OR IGNORE INTO songs (song) VALUES (?)', [(song,) for song in songs])
+
+    def claim(self, owner):
+        """
+        lease the next song that is pending, or whose lease has expired
+        :param owner: (str) the identity of the claiming worker
+        :return: (str) the claimed song, None if there is no song to claim right now
+        """
+        now = time.time()
+        conn = self.__connect()
+        try:
+            # an immediate transaction takes the write lock, so two workers never claim the same song
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute("UPDATE songs SET state = 'failed', owner = NULL WHERE state = 'leased' AND lease_expires < ? "
+                         "AND attempts >= ?", (now, self.max_attempts))
+            row = conn.execute("SELECT song FROM songs WHERE state = 'pending' OR (state = 'leased' AND "
+                               "lease_expires < ?) ORDER BY song LIMIT 1", (now,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE songs SET state = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1 "
+                             "WHERE song = ?", (owner, now + self.lease_time, row[0]))
+            conn.commit()
+        finally:
+            conn.close()
+        return None if row is None else row[0]
+
+    def renew(self, song, owner):
+        """
+        extend the lease of a claimed song
+        :param song: the claimed song
+        :param owner: (str) the identity of the worker holding the lease
+        :return: (bool) True if the worker still holds the lease, False if it expired and was claimed by another
+        """
+        with self.__connect() as conn:
+            renewed = conn.execute("UPDATE songs SET lease_expires = ? WHERE song = ? AND owner = ? AND "
+                                   "state = 'leased'", (time.time() + self.lease_time, song, owner)).rowcount
+        return renewed == 1
+
+    @contextlib.contextmanager
+    def keep_alive(self, song, owner):
+        """
+        a context renewing the lease of a claimed song (from a background thread) for as long as it is extracted
+        :param song: the claimed song
+        :param owner: (str) the identity of the worker holding the lease
+        """
+        stop = threading.Event()
+
+        def renew_until_stopped():
+            while not stop.wait(self.lease_time / 3):
+                self.renew(song, owner)
+
+        renewer = threading.Thread(target=renew_until_stopped, daemon=True)
+        renewer.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            renewer.join()
+
+    def complete(self, song, owner, features):
+        """
+        write the features of a claimed song, ending its lease
+        :param song: the claimed song
+        :param owner: (str) the identity of the worker holding the lease
+        :param features: (dict) the features (keys = feature labels, values = feature values), None for a song that
+                         could not be processed
+        :return: (bool) True if the features were written, False if the lease was lost to another worker
+        """
+        if features is None:
+            state, serialized = 'failed', None
+        else:
+            state, serialized = 'done', json.dumps({label: float(value) for label, value in features.items()})
+        with self.__connect() as conn:
+            completed = conn.execute("UPDATE songs SET state = ?, features = ?, owner = NULL WHERE song = ? AND "
+                                     "owner = ? AND state = 'leased'", (state, serialized, song, owner)).rowcount
+        return completed == 1
+
+    def is_finished(self):
+        """
+        :return: (bool) True if every song in the queue is done or failed
+        """
+        with self.__connect() as conn:
+            remaining = conn.execute("SELECT COUNT(*) FROM songs WHERE state IN ('pending', 'leased')").fetchone()[0]
+        return remaining == 0
+
+    def progress(self):
+        """
+        :return: (dict) the number of songs in every state ('pending', 'leased', 'done', 'failed')
+        """
+        counts = dict.fromkeys(['pending', 'leased', 'done', 'failed'], 0)
+        with self.__connect() as conn:
+            counts.update(conn.execute('SELECT state, COUNT(*) FROM songs GROUP BY state').fetchall())
+        return counts
+
+    def results(self):
+        """
+        :return: (dict) the features of every done song (keys = songs, values = dicts of features)
+        """
+        with self.__connect() as conn:
+            rows = conn.execute("SELECT song, features FROM songs WHERE state = 'done'").fetchall()
+        return {song: json.loads(features) for song, features in rows}
+
+    def report(self):
+        """
+        :return: (pandas DataFrame) a row per song, with its state, the worker holding its lease and its attempts
+        """
+        with self.__connect() as conn:
+            rows = conn.execute('SELECT song, state, owner, attempts FROM songs ORDER BY song').fetchall()
+        return pd.DataFrame(rows, columns=['song', 'state', 'owner', 'attempts']).set_index('song')
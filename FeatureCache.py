@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+# bump whenever the extracted features (their labels, order or the way they are computed) change,
+# so stale vectors are never served from an existing cache
+FEATURE_SCHEMA_VERSION = 1
+
+
+def content_hash(file_path):
+    """
+    hash the content of a file
+    :param file_path: the path to the file
+    :return: (str) the SHA-256 hex digest of the file content
+    :raise: FileNotFoundError if the file does not exist
+    """
+    file_hash = hashlib.sha256()
+    with open(file_path, 'rb') as content:
+        for block in iter(lambda: content.read(1024 * 1024), b''):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+class FeatureCache:
+    """
+    A persistent, content-addressed cache of extracted feature vectors.
+    the features are stored in a local SQLite file, keyed by a hash of the audio file content and the feature
+    schema version. the cache is bounded by size and evicts the least recently used entries
+    """
+    def __init__(self, db_path='ExtractedData/feature_cache.sqlite', max_size=64 * 1024 * 1024):
+        """
+        initializing the cache, creating the SQLite file if it does not exist
+        :param db_path: the path to the SQLite file of the cache
+        :param max_size: (int) the maximal size (in bytes) of the stored feature vectors
+        """
+        self.db_path = db_path
+        self.max_size = max_size
+        db_dir = os.path.dirname(db_path)
+        if db_dir and not os.path.isdir(db_dir):
+            os.makedirs(db_dir)
+        with self.__connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS features '
+                         '(key TEXT PRIMARY KEY, features TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS features_last_access ON features (last_access)')
+
+    def __connect(self):
+        """
+        open a connection to the SQLite file. a connection is opened per operation so the cache can be shared
+        (and pickled) between processes
+        :return: a sqlite3 connection
+        """
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    @staticmethod
+    def key(file_path, variant=''):
+        """
+        compute the cache key of an audio file
+        :param file_path: the path to the audio file
+        :param variant: (str) the name of the extraction variant, for features that are not computed by the default
+                        pipeline
+        :return: (str) the hash of the file content, the feature schema version and the variant
+        :raise: FileNotFoundError if the file does not exist
+        """
+        return '{0}:{1}:{2}'.format(content_hash(file_path), FEATURE_SCHEMA_VERSION, variant)
+
+    @staticmethod
+    def buffer_key(buffer, variant=''):
+        """
+        compute the cache key of an encoded audio buffer, the same as the key of a file with that content
+        :param buffer: (bytes, memoryview) the encoded audio
+        :param variant: (str) the name of the extraction variant (see FeatureCache.key)
+        :return: (str) the hash of the buffer, the feature schema version and the variant
+        """
+        return '{0}:{1}:{2}'.format(hashlib.sha256(buffer).hexdigest(), FEATURE_SCHEMA_VERSION, variant)
+
+    def get(self, key):
+        """
+        get the features stored under a key, marking them as recently used
+        :param key: (str) the cache key (see FeatureCache.key)
+        :return: (dict) the features (keys = feature labels, values = feature values), None if not in the cache
+        """
+        with self.__connect() as conn:
+            row = conn.execute('SELECT features FROM features WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            conn.execute('UPDATE features SET last_access = ? WHERE key = ?', (time.time(), key))
+        return json.loads(row[0])
+
+    def put(self, key, features):
+        """
+        store the features of a song, evicting the least recently used entries if the cache exceeds its size
+        :param key: (str) the cache key (see FeatureCache.key)
+        :param features: (dict) the features (keys = feature labels, values = feature values)
+        """
+        serialized = json.dumps({label: float(value) for label, value in features.items()})
+        with self.__connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO features (key, features, size, last_access) VALUES (?, ?, ?, ?)',
+                         (key, serialized, len(serialized), time.time()))
+            self.__evict(conn)
+
+    def __evict(self, conn):
+        """
+        delete the least recently used entries until the cache fits its maximal size
+        :param conn: an open sqlite3 connection
+        """
+        total_size = conn.execute('SELECT COALESCE(SUM(size), 0) FROM features').fetchone()[0]
+        if total_size <= self.max_size:
+            return
+        evicted = []
+        for key, size in conn.execute('SELECT key, size FROM features ORDER BY last_access'):
+            if total_size <= self.max_size:
+                break
+            evicted.append((key,))
+            total_size -= size
+        conn.executemany('DELETE FROM features WHERE key = ?', evicted)
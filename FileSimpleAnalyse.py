@@ -6,12 +6,27 @@ import librosa
 
 class FileSimpleAnalyse:
 
-    def __init__(self, file_name):
+    def __init__(self, file_name, audio_store=None):
+        """
+        :param file_name: the path to the audio file
+        :param audio_store: (DecodedAudioStore) the file is decoded once into this store and memory-mapped from it
+                            afterwards, None for always decoding
+        """
         output_file("{0} entire sound.html".format(file_name))
         self.file_path = file_name
+        self.audio_store = audio_store
+
+    def load(self):
+        """
+        decode the file, through the decoded audio store if there is one
+        :return: (np array, int) the audio time series and its sampling rate
+        """
+        if self.audio_store is None:
+            return librosa.load(self.file_path)
+        return self.audio_store.load(self.file_path)
 
     def plot_entire_file(self):
-        y, sr = librosa.load(self.file_path)
+        y, sr = self.load()
         p1 = figure(title="all file", x_axis_label='x', y_axis_label='y')
         p1.line(np.linspace(0, len(y)), y, legend="Temp.", line_width=2)
         show(p1)
@@ -21,21 +36,21 @@ class FileSimpleAnalyse:
         print('Estimated tempo: {:.2f} beats per minute'.format(tempo))
 
     def plot_percussions(self):
-        y, sr = librosa.load(self.file_path)
+        y, sr = self.load()
         y_harmonic, y_percussive = librosa.effects.hpss(y)
         p2 = figure(title="only percussions", x_axis_label='x', y_axis_label='y')
         p2.line(np.linspace(0, len(y_percussive)), y_percussive, legend="Temp.", line_width=2)
         show(p2)
 
     def plot_harmonics(self):
-        y, sr = librosa.load(self.file_path)
+        y, sr = self.load()
         y_harmonic, y_percussive = librosa.effects.hpss(y)
         p3 = figure(title="only harmonics", x_axis_label='x', y_axis_label='y')
         p3.line(np.linspace(0, len(y_harmonic)), y_harmonic, legend="Temp.", line_width=2)
         show(p3)
 
     def plot_all(self):
-        y, sr = librosa.load(self.file_path)
+        y, sr = self.load()
         # create a new plot with a title and axis labels
         p1 = figure(title="all file", x_axis_label='x', y_axis_label='y')
 
@@ -1,13 +1,13 @@
 import tkinter as tk
-import numpy as np
 from tkinter import *
 from tkinter import ttk
 from tkinter.filedialog import askopenfilename
 from tkinter import messagebox
 from PIL import Image, ImageTk
-from PredictionModule import KNearNeighborsPrediction
-from SongFeatureExtractor import song_processing
+from FeatureCache import FeatureCache
 import warnings
+# numpy, the prediction module (sklearn) and the song processing (librosa, numba and the crawlers) are imported when
+# the first song is analysed, so the window comes up without waiting for them
 
 # the apps tkinter main Style attribute
 LARGE_FONT = ("Verdana", 20)
@@ -142,6 +142,11 @@ class SongAnalyzer(tk.Frame):
         b2 = Button(self, text='Back Home', command=self.clean_and_back_home)
         b2.grid(row=6, column=0, columnspan=3)
 
+        # songs that were already analysed are not decoded again, and re-uploads of them are not processed again
+        # (the duplicate index is created with the first analysed song, see get_feature)
+        self.feature_cache = FeatureCache()
+        self.duplicate_index = None
+
     def clean_and_back_home(self):
         self.entry_song_path.delete(0, END)
         self.entry_song_name.delete(0, END)
@@ -176,6 +181,9 @@ class SongAnalyzer(tk.Frame):
         it shows the user the prediction in a text box under the true Y extracted from Youtube.
         :return:
         """
+        import numpy as np
+        from PredictionModule import KNearNeighborsPrediction
+        from SongFeatureExtractor import MEDIAN_LYRICS_FEATURES
         self.lyrics_text.config(state=NORMAL)
         self.lyrics_text.delete('2.0', END)
         self.lyrics_text.config(state=DISABLED)
@@ -203,7 +211,7 @@ class SongAnalyzer(tk.Frame):
             X_test = song_dict['features']
             if X_test[-1] is None:
                 # fill with median values
-                X_test[len(X_test)-4:] = [0.080717489, 0.03125, 0.429372, 0.9359]
+                X_test[len(X_test)-4:] = MEDIAN_LYRICS_FEATURES
 
             messagebox.showinfo("Please wait...", "Now predicting song success!")
         else:
@@ -230,7 +238,12 @@ class SongAnalyzer(tk.Frame):
         and retrieve the musical features.
         :return: a dictionary with song features, song like number on youtube, lyrics etc. .
         """
-        return song_processing(self.entry_song_path.get(), self.entry_song_name.get(), self.entry_artist_name.get())
+        from DuplicateIndex import DuplicateIndex
+        from SongFeatureExtractor import song_processing
+        if self.duplicate_index is None:
+            self.duplicate_index = DuplicateIndex()
+        return song_processing(self.entry_song_path.get(), self.entry_song_name.get(), self.entry_artist_name.get(),
+                               feature_cache=self.feature_cache, duplicate_index=self.duplicate_index)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,118 @@
+import contextlib
+import time
+import tracemalloc
+import pandas as pd
+
+
+class PipelineProfiler:
+    """
+    Opt-in instrumentation of the audio feature extraction pipeline.
+    every stage of every file (decoding, HPSS, beat tracking, CQT...) is recorded with its wall time, CPU time and
+    peak memory allocation (traced by tracemalloc).
+    the tracing is started by the first stage and stays on after the extraction (the extractors do not own the
+    profiler), the caller stops it with close() once done profiling, or uses the profiler as a context manager:
+        with PipelineProfiler() as profiler:
+            AudioFeatureExtractor(dir_path, profiler=profiler).extract_features()
+        print(profiler.summary())
+    """
+    def __init__(self, callback=None, trace_memory=True):
+        """
+        initializing the profiler
+        :param callback: a function called with every record (dict) as soon as its stage ends, None for no callback
+        :param trace_memory: (bool) if True, the peak allocation of every stage is traced (tracemalloc slows the
+                             extraction down)
+        """
+        self.callback = callback
+        self.trace_memory = trace_memory
+        self.records = []
+        self.__started_tracing = False
+
+    def __getstate__(self):
+        """
+        the profiler is sent to worker processes without its callback and records (see profiled_song_features)
+        """
+        return {'callback': None, 'trace_memory': self.trace_memory, 'records': [],
+                '_PipelineProfiler__started_tracing': False}
+
+    def __enter__(self):
+        """
+        :return: the profiler
+        """
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """
+        stop tracing the memory allocations (see close)
+        """
+        self.close()
+
+    @contextlib.contextmanager
+    def stage(self, file_name, stage):
+        """
+        record a stage of the pipeline
+        :param file_name: the file the stage runs on
+        :param stage: (str) the name of the stage
+        """
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.__started_tracing = True
+            if hasattr(tracemalloc, 'reset_peak'):
+                tracemalloc.reset_peak()
+            else:
+                tracemalloc.clear_traces()
+            start_memory = tracemalloc.get_traced_memory()[0]
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            record = {'file': file_name, 'stage': stage,
+                      'wall_time': time.perf_counter() - start_wall, 'cpu_time': time.process_time() - start_cpu,
+                      'peak_memory': tracemalloc.get_traced_memory()[1] - start_memory if self.trace_memory else None}
+            self.add(record)
+
+    def add(self, record):
+        """
+        add a record (of a stage that ran elsewhere, e.g. in a worker process)
+        :param record: (dict) {'file', 'stage', 'wall_time', 'cpu_time', 'peak_memory'}
+        """
+        self.records.append(record)
+        if self.callback is not None:
+            self.callback(record)
+
+    def report(self):
+        """
+        :return: (pandas DataFrame) a row per file and stage, with the wall time and CPU time (in seconds) and the
+                 peak allocation (in bytes) of the stage
+        """
+        return pd.DataFrame(self.records, columns=['file', 'stage', 'wall_time', 'cpu_time', 'peak_memory'])
+
+    def summary(self):
+        """
+        :return: (pandas DataFrame) a row per stage, with the total wall and CPU time over all files, their share of
+                 the total wall time and the maximal peak allocation
+        """
+        summary = self.report().groupby('stage').agg({'wall_time': 'sum', 'cpu_time': 'sum', 'peak_memory': 'max'})
+        summary['wall_time_share'] = summary['wall_time'] / summary['wall_time'].sum()
+        return summary.sort_values('wall_time', ascending=False)
+
+    def close(self):
+        """
+        stop tracing the memory allocations, if this profiler started it
+        """
+        if self.__started_tracing:
+            tracemalloc.stop()
+            self.__started_tracing = False
+
+
+def profile_stage(profiler, file_name, stage):
+    """
+    a context recording a stage with the given profiler, or doing nothing if there is no profiler
+    :param profiler: (PipelineProfiler) the profiler, None for no profiling
+    :param file_name: the file the stage runs on
+    :param stage: (str) the name of the stage
+    :return: a context manager
+    """
+    if profiler is None:
+        return contextlib.nullcontext()
+    return profiler.stage(file_name, stage)
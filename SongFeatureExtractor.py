@@ -1,21 +1,74 @@
 import numpy as np
+import pandas as pd
+import time
 # import os
 # import warnings
 from AudioFeatureExtractor import SingleAudioFeatureExtractor
 from CrawlerTool import CrawlerTool
 
+# the medians of the lyrics features in our dataset, used for songs without lyrics
+# ['most Freq', 'repetitive', 'offensive', 'spellScheck']
+MEDIAN_LYRICS_FEATURES = [0.080717489, 0.03125, 0.429372, 0.9359]
 
-def song_processing(audio_file_path, song_name, artist_name):
+
+def song_record(result):
+    """
+    the JSON serializable record of the result of song_processing (see DuplicateIndex.add)
+    :param result: (dict) the result of song_processing
+    :return: (dict) the result, with the features as a list. the lyrics features of a song without lyrics stay None
+             (not NaN), so the median filling of the GUI applies to its duplicates as well
+    """
+    record = dict(result)
+    record['features'] = [None if value is None else float(value) for value in result['features']]
+    return record
+
+
+def song_variant(song_name, artist_name):
+    """
+    the duplicate index variant of the results of song_processing, so a duplicate is reused only for the same searched
+    song (the crawled views and lyrics depend on the song and artist names, not on the audio)
+    :param song_name: the name of the song
+    :param artist_name: the name of the artist
+    :return: (str) the variant (see DuplicateIndex.find)
+    """
+    names = [' '.join(str(name).lower().split()) for name in (song_name, artist_name)]
+    return 'song_processing:{0}|{1}'.format(*names)
+
+
+def song_result(record):
+    """
+    the result of song_processing stored in a record (see song_record)
+    :param record: (dict) the record
+    :return: (dict) the result, with the features as an array (an object array holding None for missing lyrics
+             features, as song_processing returns it)
+    """
+    result = dict(record)
+    result['features'] = np.array(record['features'])
+    return result
+
+
+def song_processing(audio_file_path, song_name, artist_name, feature_cache=None, duplicate_index=None):
     """
     Extract all features (audio and lyrics) from a given song
     :param audio_file_path:  the file to the audio path
     :param song_name: the name of the song (for searching the lyrics)
     :param artist_name: the name of the artist (for searching the lyrics)
+    :param feature_cache: (FeatureCache) a persistent cache for the audio features, None for always extracting them
+    :param duplicate_index: (DuplicateIndex) if the song is a near-duplicate of a song in this index (e.g. a re-upload
+                            under another file name) that was processed with the same song and artist names, the
+                            result of that song is returned without extracting or crawling, None for always
+                            processing
     :return: (dict) {'features': (ndarray) 14 features, 'y': (str) the number of views for this song in youtube,
                         'youtube_title': (str) the video title of youtube, 'lyrics': (str) the lyrics for the song
     """
     try:
-        audio_feature_extractor = SingleAudioFeatureExtractor(audio_file_path)
+        if duplicate_index is not None:
+            variant = song_variant(song_name, artist_name)
+            fingerprint = duplicate_index.fingerprint(audio_file_path)
+            duplicate = duplicate_index.find(fingerprint, variant=variant)[1]
+            if duplicate is not None:
+                return song_result(duplicate)
+        audio_feature_extractor = SingleAudioFeatureExtractor(audio_file_path, cache=feature_cache)
         if not audio_feature_extractor:
             return None
         lyrics_feature_extractor = CrawlerTool()
@@ -27,11 +80,66 @@ def song_processing(audio_file_path, song_name, artist_name):
         y = song_crawler_data['numberOfViews']
         youtube_title = song_crawler_data['youTube_title']
         lyrics = song_crawler_data['lyrics']
-        return {'features': features, 'y': y, 'youtube_title': youtube_title, 'lyrics': lyrics}
+        result = {'features': features, 'y': y, 'youtube_title': youtube_title, 'lyrics': lyrics}
+        if duplicate_index is not None:
+            duplicate_index.add(audio_file_path, fingerprint, song_record(result), variant=variant)
+        return result
     except:
         return None
 
 
+def preview_accuracy_report(audio_file_paths, classifier=None, lyrics_features=None, **preview_kwargs):
+    """
+    measure how far the fast preview extraction tier drifts from the full extraction on a reference set of songs
+    :param audio_file_paths: the paths to the audio files of the reference set
+    :param classifier: (KNearNeighborsPrediction) a trained classifier, if given the agreement between the classes
+                       predicted from the full and from the preview features is reported
+    :param lyrics_features: the 4 lyrics features of every song (aligned with the audio file paths), completing the
+                            vectors the classifier gets. if None, the medians of our dataset are used for all songs
+    :param preview_kwargs: the excerpts of the preview tier ('preview_segments', 'preview_duration', 'preview_sr')
+    :return: (dict) {'drift': (pandas DataFrame) the mean absolute, mean relative and max relative error of every
+                     feature, 'songs': (int) number of songs compared, 'full_time': (float) seconds of full extraction,
+                     'preview_time': (float) seconds of preview extraction, 'speedup': (float),
+                     'class_agreement': (float) the ratio of songs classified the same, None without a classifier}
+    """
+    full_rows, preview_rows, compared = [], [], []
+    full_time, preview_time = 0.0, 0.0
+    labels = None
+    for i, audio_file_path in enumerate(audio_file_paths):
+        start = time.perf_counter()
+        full_extractor = SingleAudioFeatureExtractor(audio_file_path)
+        if not full_extractor:
+            continue
+        full_rows.append(full_extractor.extract_features())
+        full_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        preview_extractor = SingleAudioFeatureExtractor(audio_file_path, preview=True, **preview_kwargs)
+        preview_rows.append(preview_extractor.extract_features())
+        preview_time += time.perf_counter() - start
+        labels = full_extractor.get_features_labels()
+        compared.append(i)
+
+    full_rows = np.array(full_rows, dtype=float)
+    preview_rows = np.array(preview_rows, dtype=float)
+    error = np.abs(preview_rows - full_rows)
+    relative_error = error / np.maximum(np.abs(full_rows), np.finfo(float).eps)
+    drift = pd.DataFrame({'mean_abs_error': error.mean(axis=0), 'mean_rel_error': relative_error.mean(axis=0),
+                          'max_rel_error': relative_error.max(axis=0)}, index=labels)
+    report = {'drift': drift, 'songs': len(compared), 'full_time': full_time, 'preview_time': preview_time,
+              'speedup': full_time / preview_time, 'class_agreement': None}
+
+    if classifier is not None:
+        if lyrics_features is None:
+            lyrics = np.tile(MEDIAN_LYRICS_FEATURES, (len(compared), 1))
+        else:
+            lyrics = np.array([lyrics_features[i] for i in compared], dtype=float)
+        full_classes = classifier.predict(np.hstack((full_rows, lyrics)))
+        preview_classes = classifier.predict(np.hstack((preview_rows, lyrics)))
+        report['class_agreement'] = np.mean(np.asarray(full_classes) == np.asarray(preview_classes))
+    return report
+
+
 # if __name__ == '__main__':
 #     file_path = 'C:\\Dan\\UNI\\Jarta.Projects\\MigHtyFi\\data\\2015\\01. Mark Ronson - Uptown Funk[www.musicbolt.com].mp3'
 #     song_name = 'Uptown Funk'
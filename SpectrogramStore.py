@@ -0,0 +1,97 @@
+import os
+import numpy as np
+import pandas as pd
+from AudioFeatureExtractor import SpectralAnalysis
+from FeatureCache import content_hash
+
+
+class SpectrogramStore:
+    """
+    An on-disk store of the analysis core of every track.
+    the magnitude spectrogram and its harmonic part are written (as float16) to a compressed '.npz' file per track,
+    keyed by the hash of its content and the analysis parameters. the percussive part is not stored, it is the
+    magnitude minus the harmonic part. a new spectral feature is then computed over the stored spectrograms of a
+    whole library, without decoding the tracks or separating them again
+    """
+    def __init__(self, store_dir='ExtractedData/spectrograms', dtype=np.float16):
+        """
+        initializing the store, creating its directory if it does not exist
+        :param store_dir: the directory the spectrograms are stored in
+        :param dtype: the type the magnitudes are stored as (float16 halves the size of float32, with a relative error
+                      below 0.1%, the derived percussive part has an error below 0.1% of the magnitude)
+        """
+        self.store_dir = store_dir
+        self.dtype = dtype
+        if not os.path.isdir(store_dir):
+            os.makedirs(store_dir)
+
+    def path(self, song_path, sr=22050, n_fft=2048, hop_length=512):
+        """
+        the path of the stored spectrogram
+        :param song_path: the path to the audio file
+        :param sr: (int) sampling rate of the analysed audio
+        :param n_fft: (int) the FFT window size
+        :param hop_length: (int) number of samples between successive frames
+        :return: the path to the '.npz' file (that may not exist yet)
+        :raise: FileNotFoundError if the audio file does not exist
+        """
+        return os.path.join(self.store_dir,
+                            '{0}_{1}_{2}_{3}.npz'.format(content_hash(song_path), sr, n_fft, hop_length))
+
+    def put(self, song_path, analysis):
+        """
+        store the analysis core of a track, unless it is already stored
+        :param song_path: the path to the audio file
+        :param analysis: (SpectralAnalysis) the analysis core of the track
+        :raise: FileNotFoundError if the audio file does not exist
+        """
+        stored_path = self.path(song_path, analysis.sr, analysis.n_fft, analysis.hop_length)
+        if os.path.isfile(stored_path):
+            return
+        # written under a temporary name first, so other processes never read a partially written file
+        temp_path = '{0}.{1}.tmp'.format(stored_path, os.getpid())
+        with open(temp_path, 'wb') as stored_file:
+            np.savez_compressed(stored_file, magnitude=analysis.magnitude.astype(self.dtype),
+                                harmonic_magnitude=analysis.harmonic_magnitude.astype(self.dtype))
+        os.replace(temp_path, stored_path)
+
+    def load(self, song_path, sr=22050, n_fft=2048, hop_length=512):
+        """
+        load the stored analysis core of a track
+        :param song_path: the path to the audio file
+        :param sr: (int) sampling rate of the analysed audio
+        :param n_fft: (int) the FFT window size
+        :param hop_length: (int) number of samples between successive frames
+        :return: (SpectralAnalysis) the analysis core (with float32 magnitudes, the percussive one derived from the
+                 stored ones), None if the track is not stored
+        :raise: FileNotFoundError if the audio file does not exist
+        """
+        stored_path = self.path(song_path, sr, n_fft, hop_length)
+        if not os.path.isfile(stored_path):
+            return None
+        with np.load(stored_path) as stored:
+            return SpectralAnalysis.from_magnitudes(stored['magnitude'].astype(np.float32),
+                                                    stored['harmonic_magnitude'].astype(np.float32),
+                                                    sr=sr, n_fft=n_fft, hop_length=hop_length)
+
+    def extract_features(self, feature_function, song_paths, sr=22050, n_fft=2048, hop_length=512):
+        """
+        compute a feature over the stored spectrograms of many tracks
+        :param feature_function: a function of a SpectralAnalysis returning a dict of features (keys = feature labels,
+                                 values = feature values)
+        :param song_paths: the paths to the audio files
+        :param sr: (int) sampling rate of the analysed audio
+        :param n_fft: (int) the FFT window size
+        :param hop_length: (int) number of samples between successive frames
+        :return: (pandas DataFrame) the features of every track (NaN values for a track that is not stored or does
+                 not exist), indexed by the song paths
+        """
+        song_paths = list(song_paths)
+        rows = []
+        for song in song_paths:
+            try:
+                analysis = self.load(song, sr, n_fft, hop_length)
+            except FileNotFoundError:
+                analysis = None
+            rows.append({} if analysis is None else feature_function(analysis))
+        return pd.DataFrame(rows, index=song_paths, dtype=float)
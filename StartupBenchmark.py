@@ -0,0 +1,49 @@
+import os
+import subprocess
+import sys
+import numpy as np
+import pandas as pd
+
+# the modules whose cold import time is measured by default: the GUI, the text features and the extraction entry points
+STARTUP_MODULES = ('GUI', 'textFeatureExtraction', 'CrawlerTool', 'SongFeatureExtractor', 'AudioFeatureExtractor')
+
+
+def import_time(module):
+    """
+    import a module in a new python process (a cold start, nothing is imported yet)
+    :param module: (str) the name of the module (of this project or installed)
+    :return: (float, int) the import time in seconds and the number of modules it loaded, (NaN, 0) if the import failed
+    """
+    code = ('import sys, time\n'
+            'loaded = len(sys.modules)\n'
+            'start = time.perf_counter()\n'
+            'import {0}\n'
+            'print(time.perf_counter() - start, len(sys.modules) - loaded)').format(module)
+    result = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    if result.returncode != 0:
+        return np.nan, 0
+    elapsed, loaded = result.stdout.decode().split()[-2:]
+    return float(elapsed), int(loaded)
+
+
+def startup_benchmark(modules=STARTUP_MODULES, repeat=3):
+    """
+    measure the cold import time of modules, each in new python processes
+    :param modules: the names of the modules
+    :param repeat: (int) number of imports of every module
+    :return: (pandas DataFrame) a row per module: its best and median import time (in seconds) and the number of
+             modules the import loaded
+    """
+    rows = []
+    for module in modules:
+        for _ in range(repeat):
+            elapsed, loaded = import_time(module)
+            rows.append({'module': module, 'time': elapsed, 'modules_loaded': loaded})
+    report = pd.DataFrame(rows).groupby('module', sort=False).agg({'time': ['min', 'median'], 'modules_loaded': 'max'})
+    report.columns = ['best_time', 'median_time', 'modules_loaded']
+    return report
+
+
+if __name__ == '__main__':
+    print(startup_benchmark())
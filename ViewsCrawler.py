@@ -6,10 +6,75 @@ import os
 from urllib.request import Request, urlopen
 import urllib.request
 import re
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from PyLyrics import *
 from textFeatureExtraction import TextFeatureExtractor
 
 
+class PoliteFetcher:
+    '''
+    runs the blocking requests of the crawler from asyncio code, in a pool of threads: a bounded number of requests
+    are in flight, overall and per host, and the requests to the same host can be spaced by a minimal delay.
+    a delay bounds the throughput of a host to 1/host_delay requests per second whatever the concurrency, so a delay
+    above the response time of the host makes the crawl slower than the sequential one.
+    must be created inside the running event loop
+    '''
+    def __init__(self, concurrency=8, host_concurrency=None, host_delay=0.0):
+        '''
+        :param concurrency: the maximal number of requests in flight
+        :param host_concurrency: the maximal number of requests in flight to the same host, None for concurrency
+        :param host_delay: the minimal time (in seconds) between the starts of two requests to the same host, 0 for
+                           no spacing
+        '''
+        self.host_concurrency = concurrency if host_concurrency is None else host_concurrency
+        self.host_delay = host_delay
+        self.__executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.__semaphore = asyncio.Semaphore(concurrency)
+        self.__host_semaphores = {}
+        self.__next_request = {}
+
+    async def call(self,host,function,*args):
+        '''
+        runs a blocking request politely
+        :param host: the host the request goes to
+        :param function: the function making the request
+        :param args: the arguments of the function
+        :return: the result of the function
+        '''
+        loop = asyncio.get_event_loop()
+        if host not in self.__host_semaphores:
+            self.__host_semaphores[host] = asyncio.Semaphore(self.host_concurrency)
+        async with self.__host_semaphores[host]:
+            # reserving the next free slot of the host, the event loop runs a single coroutine at a time
+            now = loop.time()
+            start = max(now, self.__next_request.get(host, now))
+            self.__next_request[host] = start + self.host_delay
+            await asyncio.sleep(start - now)
+            async with self.__semaphore:
+                return await loop.run_in_executor(self.__executor, function, *args)
+
+    async def fetch(self,url,headers=None):
+        '''
+        :param url: the url of the page
+        :param headers: the headers of the request
+        :return: the content of the page (bytes)
+        '''
+        return await self.call(urllib.parse.urlsplit(url).netloc, read_page, url, headers)
+
+    def close(self):
+        self.__executor.shutdown(wait=False)
+
+
+def read_page(url,headers=None):
+    '''
+    :param url: the url of the page
+    :param headers: the headers of the request
+    :return: the content of the page (bytes)
+    '''
+    return urlopen(Request(url, headers=headers or {})).read()
+
+
 class ViewsCrawler:
 
 
@@ -17,8 +82,16 @@ class ViewsCrawler:
     this class represents a youtube crawler, givven the youube query, the crawler will retrieve the data of the first result.
     '''
 
-    def __init__(self):
+    def __init__(self,search_url="http://www.youtube.com/results?",watch_url="http://www.youtube.com/watch?v="):
+        '''
+        :param search_url: the url of the youtube search results (the query string is appended to it)
+        :param watch_url: the url of a youtube video (the video id is appended to it)
+        '''
         self.songsCompleted = 0;
+        self.search_url = search_url
+        self.watch_url = watch_url
+        # one extractor for all the songs, its resources are loaded once
+        self.textFeatureExtractor = TextFeatureExtractor()
 
     def getSongData(self,songName):
 
@@ -28,12 +101,8 @@ class ViewsCrawler:
             :return: a jason object with the songs youtube data
             '''
             query_string = urllib.parse.urlencode({"search_query" : songName})
-            html_content = urllib.request.urlopen("http://www.youtube.com/results?" + query_string)
-            search_results = re.findall(r'href=\"\/watch\?v=(.{11})', html_content.read().decode())
-            if search_results[0]:
-                url = "http://www.youtube.com/watch?v=" + search_results[0]
-            else:
-                print("no match found for "+songName)
+            html_content = urllib.request.urlopen(self.search_url + query_string)
+            url = self.getVideoUrl(html_content.read(), songName)
 
             ctx = ssl.create_default_context()
             ctx.check_hostname = False
@@ -44,49 +113,93 @@ class ViewsCrawler:
             req = Request(url, headers={'User-Agent': 'Mozilla/5.0'})
             webpage = urlopen(req).read()
 
-            # Creating a BeautifulSoup object of the html page for easy extraction of data.
+            return self.getVideoDetails(webpage)
+        except:
+            if songName:
+                print("error: "+ songName)
+            else: print("song is null!!!!!!!!!!!!!!!")
 
-            soup = BeautifulSoup(webpage, 'html.parser')
-            video_details = {}
+    async def getSongDataAsync(self,songName,fetcher):
+        '''
+        the asyncio version of getSongData, the two pages are fetched through the fetcher
+        :param songName: the query for youtube to search (updated to song and artist)
+        :param fetcher: a PoliteFetcher
+        :return: a jason object with the songs youtube data
+        '''
+        try:
+            query_string = urllib.parse.urlencode({"search_query" : songName})
+            url = self.getVideoUrl(await fetcher.fetch(self.search_url + query_string), songName)
+            webpage = await fetcher.fetch(url, {'User-Agent': 'Mozilla/5.0'})
+            return self.getVideoDetails(webpage)
+        except:
+            if songName:
+                print("error: "+ songName)
+            else: print("song is null!!!!!!!!!!!!!!!")
+
+    def getVideoUrl(self,search_page,songName):
+        '''
+        :param search_page: the youtube search results page (bytes)
+        :param songName: the query of the search
+        :return: the url of the first result
+        '''
+        search_results = re.findall(r'href=\"\/watch\?v=(.{11})', search_page.decode())
+        if search_results[0]:
+            url = self.watch_url + search_results[0]
+        else:
+            print("no match found for "+songName)
+        return url
 
-            for span in soup.findAll('span',attrs={'class': 'watch-title'}):
-                video_details['TITLE'] = span.text.strip()
+    def getVideoDetails(self,webpage):
+        '''
+        :param webpage: the youtube page of the video (bytes)
+        :return: a jason object with the songs youtube data
+        '''
+        # Creating a BeautifulSoup object of the html page for easy extraction of data.
 
-            for script in soup.findAll('script',attrs={'type': 'application/ld+json'}):
-                    channelDesctiption = json.loads(script.text.strip())
-                    video_details['CHANNEL_NAME'] = channelDesctiption['itemListElement'][0]['item']['name']
+        soup = BeautifulSoup(webpage, 'html.parser')
+        video_details = {}
 
-            for div in soup.findAll('div',attrs={'class': 'watch-view-count'}):
-                video_details['NUMBER_OF_VIEWS'] = div.text.strip()
+        for span in soup.findAll('span',attrs={'class': 'watch-title'}):
+            video_details['TITLE'] = span.text.strip()
 
-            for button in soup.findAll('button',attrs={'title': 'I like this'}):
-                video_details['LIKES'] = button.text.strip()
+        for script in soup.findAll('script',attrs={'type': 'application/ld+json'}):
+                channelDesctiption = json.loads(script.text.strip())
+                video_details['CHANNEL_NAME'] = channelDesctiption['itemListElement'][0]['item']['name']
 
-            for button in soup.findAll('button',attrs={'title': 'I dislike this'}):
-                video_details['DISLIKES'] = button.text.strip()
+        for div in soup.findAll('div',attrs={'class': 'watch-view-count'}):
+            video_details['NUMBER_OF_VIEWS'] = div.text.strip()
 
-            for span in soup.findAll('span',attrs={'class': 'yt-subscription-button-subscriber-count-branded-horizontal yt-subscriber-count'}):
-                video_details['NUMBER_OF_SUBSCRIPTIONS'] = span.text.strip()
+        for button in soup.findAll('button',attrs={'title': 'I like this'}):
+            video_details['LIKES'] = button.text.strip()
 
-            hashtags = []
-            for span in soup.findAll('span',attrs={'class': 'standalone-collection-badge-renderer-text'}):
-                for a in span.findAll('a',attrs={'class': 'yt-uix-sessionlink'}):
-                    hashtags.append(a.text.strip())
-            video_details['HASH_TAGS'] = hashtags
+        for button in soup.findAll('button',attrs={'title': 'I dislike this'}):
+            video_details['DISLIKES'] = button.text.strip()
 
-            return video_details;
-        except:
-            if songName:
-                print("error: "+ songName)
-            else: print("song is null!!!!!!!!!!!!!!!")
+        for span in soup.findAll('span',attrs={'class': 'yt-subscription-button-subscriber-count-branded-horizontal yt-subscriber-count'}):
+            video_details['NUMBER_OF_SUBSCRIPTIONS'] = span.text.strip()
 
-    def processDirectory(self,directoryPath,jsonFile, verify=True):
+        hashtags = []
+        for span in soup.findAll('span',attrs={'class': 'standalone-collection-badge-renderer-text'}):
+            for a in span.findAll('a',attrs={'class': 'yt-uix-sessionlink'}):
+                hashtags.append(a.text.strip())
+        video_details['HASH_TAGS'] = hashtags
+
+        return video_details;
+
+    def processDirectory(self,directoryPath,jsonFile, verify=True, concurrency=1, host_concurrency=None,
+                         host_delay=0.0):
         self.songsCompleted = 0;
         '''
 
         :param directoryPath: the path of the directory to iterate over
         :param jsonFile: the output json file (if does not exist -> will be created)
         :param verify: if true, will verify for each file, that an entry exists in the JSON file (by default is true)
+        :param concurrency: the number of songs crawled at once, 1 for crawling one song at a time. above 1 the songs
+                            are crawled with asyncio (see PoliteFetcher)
+        :param host_concurrency: the maximal number of requests in flight to the same host (when concurrency > 1),
+                                 None for concurrency
+        :param host_delay: the minimal time (in seconds) between two requests to the same host (when concurrency > 1).
+                           a host is then requested at most 1/host_delay times per second (see PoliteFetcher)
         :return: for each song in the directory, appends the songs youtube data to the data.json file
         '''
 
@@ -112,17 +225,21 @@ class ViewsCrawler:
             # iterate over all files in the given directory
             print("Sending crawlers...")
 
-            for filename in os.listdir(directoryPath):
-                if filename == '.DS_Store':
-                    continue
-                songName = self.getSongName(filename)
-                if not songName:
-                    print(filename + " is null!!!")
-                    continue
-
-                self.addSongData(songName,data,error, filename,no_lyrics)
-                with open(jsonFile, 'w', encoding='utf8') as outfile:
-                    json.dump(data, outfile, ensure_ascii=False, indent=4)
+            if concurrency > 1:
+                asyncio.run(self.processDirectoryAsync(directoryPath, jsonFile, data, error, no_lyrics, concurrency,
+                                                       host_concurrency, host_delay))
+            else:
+                for filename in os.listdir(directoryPath):
+                    if filename == '.DS_Store':
+                        continue
+                    songName = self.getSongName(filename)
+                    if not songName:
+                        print(filename + " is null!!!")
+                        continue
+
+                    self.addSongData(songName,data,error, filename,no_lyrics)
+                    with open(jsonFile, 'w', encoding='utf8') as outfile:
+                        json.dump(data, outfile, ensure_ascii=False, indent=4)
 
         if (len(error) > 0):
             print("\n\nerror in(" + str(len(error)) + "):\n" + str(error))
@@ -134,6 +251,50 @@ class ViewsCrawler:
 
 
 
+    async def processDirectoryAsync(self,directoryPath,jsonFile,data,error,no_lyrics,concurrency,host_concurrency,
+                                    host_delay):
+        '''
+        the asyncio crawl of processDirectory: up to concurrency songs are crawled at once
+        :param directoryPath: the path of the directory to iterate over
+        :param jsonFile: the output json file, rewritten whenever a song is done
+        :param data: the json object of the songs (see addSongData)
+        :param error: list of files no youtub match found
+        :param no_lyrics: a list with the number of songs that no lyrics were retrieved
+        :param concurrency: the maximal number of requests in flight
+        :param host_concurrency: the maximal number of requests in flight to the same host, None for concurrency
+        :param host_delay: the minimal time (in seconds) between two requests to the same host
+        :return: adds the data of every song to the dictianary
+        '''
+        fetcher = PoliteFetcher(concurrency, host_concurrency, host_delay)
+        # the text feature extractor (and the lazy loading of its nltk resources) is not thread safe, a single thread
+        # extracts the features of all the songs
+        feature_executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            await asyncio.gather(*[self.processFileAsync(filename, jsonFile, data, error, no_lyrics, fetcher,
+                                                         feature_executor)
+                                   for filename in os.listdir(directoryPath) if filename != '.DS_Store'])
+        finally:
+            fetcher.close()
+            feature_executor.shutdown(wait=False)
+
+    async def processFileAsync(self,filename,jsonFile,data,error,no_lyrics,fetcher,feature_executor):
+        '''
+        crawls a single song of processDirectoryAsync
+        :param filename: the song file name
+        :param fetcher: the PoliteFetcher of the crawl
+        :param feature_executor: the single thread executor extracting the text features
+        (the other parameters are the ones of processDirectoryAsync)
+        '''
+        songName = self.getSongName(filename)
+        if not songName:
+            print(filename + " is null!!!")
+            return
+
+        await self.addSongDataAsync(songName, data, error, filename, no_lyrics, fetcher, feature_executor)
+        with open(jsonFile, 'w', encoding='utf8') as outfile:
+            json.dump(data, outfile, ensure_ascii=False, indent=4)
+
+
     def getFeatures(self,lyrics):
 
         '''
@@ -141,8 +302,7 @@ class ViewsCrawler:
         :param lyrics: the text to break down
         :return: features
         '''
-        tfe = TextFeatureExtractor()
-        return tfe.extract(lyrics)
+        return self.textFeatureExtractor.extract(lyrics)
 
 
     def addSongData(self,songName, dictionary,error,fileName,no_lyrics):
@@ -189,6 +349,56 @@ class ViewsCrawler:
 
 
 
+    async def addSongDataAsync(self,songName,dictionary,error,fileName,no_lyrics,fetcher,feature_executor):
+        '''
+        the asyncio version of addSongData, fills the same record of the song in the dictionary. the requests go through
+        the fetcher, and the text features are extracted in the feature executor so the other songs keep crawling.
+        unlike addSongData, a song with no youtube data is added to error (and not to the dictionary) and the crawl
+        goes on
+        :param songName: song name
+        :param dictionary: a valid json object
+        :param error: list of files no youtub match found
+        :param fileName: name of the file
+        :param no_lyrics: a list with the number of songs that no lyrics were retrieved
+        :param fetcher: the PoliteFetcher of the crawl
+        :param feature_executor: a single thread executor (the text feature extractor is not thread safe)
+        :return: adds data to the dictianary
+        '''
+        #   get song data from youtube
+        artist = self.getArtist(fileName)
+        print("--"+songName+"-----" + artist + "--")
+        if fileName not in dictionary:
+            query = songName + " " + artist
+            info = await self.getSongDataAsync(query, fetcher)
+            if info is None:
+                error[fileName] = "no youtube data"
+            else:
+                #   add song data to dictionary
+                dictionary[fileName] = info
+                dictionary[fileName]['song_name'] = songName
+
+        # get lyrics and fetures if they do not exist
+        if fileName in dictionary and 'lyrics' not in dictionary[fileName]:
+
+            try:
+                lyrics = await fetcher.call('lyrics', self.getLyrics, songName, artist)
+
+                if not lyrics:
+                    no_lyrics[songName+ "->" + artist] = "no Lyrics"
+                else:
+                    dictionary[fileName]['lyrics'] = lyrics
+
+                features = await asyncio.get_event_loop().run_in_executor(feature_executor, self.getFeatures, lyrics)
+                dictionary[fileName]['features'] = features
+            except:
+                print("error lyrics:" + songName)
+
+        #   update and print progress
+        self.songsCompleted += 1
+        percent = int(self.songsCompleted / self.total_songs * 100)
+        print("\rCompleted: " + str(percent) + "%", end='')
+
+
     def getSongName(self,filename):
         '''
         givan an audio file (with specific format) will retern the song name
@@ -0,0 +1,47 @@
+import numpy as np
+from DuplicateIndex import DuplicateIndex
+from SongFeatureExtractor import song_processing, song_record, song_result, song_variant, MEDIAN_LYRICS_FEATURES
+
+FINGERPRINT = ((np.arange(1000, dtype=np.uint64) * 2654435761 % 2**32).astype(np.uint32), 200.0)
+
+
+class FixedFingerprintIndex(DuplicateIndex):
+    """
+    a duplicate index whose songs all have the same fingerprint (every song is a duplicate of the stored one)
+    """
+    def fingerprint(self, song_path):
+        return FINGERPRINT
+
+
+def no_lyrics_result():
+    """
+    :return: (dict) a result of song_processing for a song without lyrics (as it builds it)
+    """
+    features = np.hstack((np.linspace(0.5, 5.0, 10), np.array([None, None, None, None])))
+    return {'features': features, 'y': '1,234 views', 'youtube_title': 'title', 'lyrics': None}
+
+
+def test_no_lyrics_features_stay_none(tmp_path):
+    index = DuplicateIndex(str(tmp_path / 'index.sqlite'))
+    index.add('song.mp3', FINGERPRINT, song_record(no_lyrics_result()), variant='song_processing')
+    result = song_result(index.find(FINGERPRINT, variant='song_processing')[1])
+    assert all(value is None for value in result['features'][-4:])
+    np.testing.assert_allclose(result['features'][:10].astype(float), np.linspace(0.5, 5.0, 10))
+
+
+def test_no_lyrics_duplicate_is_median_filled(tmp_path):
+    index = FixedFingerprintIndex(str(tmp_path / 'index.sqlite'))
+    index.add('song.mp3', FINGERPRINT, song_record(no_lyrics_result()), variant=song_variant('Song ', 'ARTIST'))
+    result = song_processing('re-upload.mp3', 'song', 'artist', duplicate_index=index)
+    X_test = result['features']
+    # the filling of the GUI (GUI.SongAnalyzer.predict_song_success)
+    assert X_test[-1] is None
+    X_test[len(X_test) - 4:] = MEDIAN_LYRICS_FEATURES
+    assert not np.isnan(X_test.astype(float)).any()
+
+
+def test_duplicate_of_another_song_is_not_reused(tmp_path):
+    index = FixedFingerprintIndex(str(tmp_path / 'index.sqlite'))
+    index.add('song.mp3', FINGERPRINT, song_record(no_lyrics_result()), variant=song_variant('song', 'artist'))
+    assert index.find(FINGERPRINT, variant=song_variant('another song', 'artist'))[1] is None
+    assert index.find(FINGERPRINT, variant=song_variant(' Song', 'Artist'))[1] is not None
@@ -1,28 +1,118 @@
 # Load library
-from nltk.corpus import stopwords
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
-import nltk
-# nltk.download('stopwords')
-# nltk.download('punkt')
-from profanity_check import predict, predict_prob
-from spellchecker.spellchecker import SpellChecker
+# nltk, pyspellchecker, scipy and profanity_check are only imported on their first use (see the get_ functions), so
+# importing this module is fast for the GUI and for processes that never extract text features
+from functools import lru_cache, partial
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from CorrectionCache import CorrectionCache
+import numpy as np
 import os
 import warnings
 
-with warnings.catch_warnings():
-    warnings.simplefilter('ignore')
-    warnings.filterwarnings('ignore')
-    for path in nltk.data.path:
-        try:
-            if 'corpora' in os.listdir(path):
-                if 'stopwords' in os.listdir(os.path.join(path, 'corpora')):
-                    break
-                else:
-                    nltk.download('stopwords')
-                    nltk.download('punkt')
-        except Exception as e:
-            print('', end='')
+
+# the labels of the text features, in the column order of TextFeatureExtractor.extract_many
+TEXT_FEATURE_LABELS = ["most Freq", "repetitive", "offensive", "spellScheck"]
+
+
+# the heavy resources are loaded on their first use and shared by all the extractors of the process
+
+@lru_cache(maxsize=None)
+def check_nltk_corpora():
+    '''
+    downloads the nltk corpora (stopwords and punkt) if they are missing, once per process
+    '''
+    import nltk
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        warnings.filterwarnings('ignore')
+        for path in nltk.data.path:
+            try:
+                if 'corpora' in os.listdir(path):
+                    if 'stopwords' in os.listdir(os.path.join(path, 'corpora')):
+                        break
+                    else:
+                        nltk.download('stopwords')
+                        nltk.download('punkt')
+            except Exception as e:
+                print('', end='')
+
+
+@lru_cache(maxsize=None)
+def get_word_tokenizer():
+    '''
+    :return: nltk's word_tokenize function
+    '''
+    check_nltk_corpora()
+    from nltk.tokenize import word_tokenize
+    return word_tokenize
+
+
+@lru_cache(maxsize=None)
+def get_stop_words():
+    '''
+    :return: a frozenset of the english stop words
+    '''
+    check_nltk_corpora()
+    from nltk.corpus import stopwords
+    return frozenset(stopwords.words('english'))
+
+
+@lru_cache(maxsize=None)
+def get_spell_checker():
+    '''
+    :return: the spell checker (loading its word frequency dictionary takes seconds)
+    '''
+    from spellchecker.spellchecker import SpellChecker
+    return SpellChecker()
+
+
+@lru_cache(maxsize=None)
+def get_profanity_predictor():
+    '''
+    :return: the predict_prob function of profanity_check (importing it loads its vectorizer and model)
+    '''
+    from profanity_check import predict_prob
+    return predict_prob
+
+
+@lru_cache(maxsize=None)
+def get_correction_cache():
+    '''
+    :return: the spelling correction cache of the process (in memory, see CorrectionCache)
+    '''
+    return CorrectionCache()
+
+
+def warm_resources():
+    '''
+    loads the shared resources, once in every worker process of TextFeatureExtractor.extract_many
+    '''
+    get_word_tokenizer()
+    get_stop_words()
+    get_spell_checker()
+    get_profanity_predictor()
+
+
+def extract_chunk(lyrics_list,correction_cache=None):
+    '''
+    generates the features of a chunk of songs (in a worker process of TextFeatureExtractor.extract_many)
+    :param lyrics_list: a list of lyrics strings
+    :param correction_cache: the CorrectionCache of the extractor, None for the one of the process
+    :return: a list with the features dictionary of every song, None for a song that could not be processed
+    '''
+    tfe = TextFeatureExtractor(correction_cache)
+    try:
+        return tfe.extract_batch(lyrics_list)
+    except Exception:
+        # a song that can not be processed (e.g. no words left after removing the stop words) fails the whole
+        # chunk, so the songs are extracted again one by one
+        features = []
+        for lyrics in lyrics_list:
+            try:
+                features.append(tfe.extract(lyrics))
+            except Exception:
+                features.append(None)
+        return features
 
 
 class TextFeatureExtractor:
@@ -30,6 +120,13 @@ class TextFeatureExtractor:
     extracts fourb text features from a given text.
     features: [most Freq, repetitive, offensive, spellScheck]
     '''
+    def __init__(self,correction_cache=None):
+        '''
+        :param correction_cache: a CorrectionCache for the spelling corrections (e.g. stored in a file, to be reused by
+                                 the next runs), None for the in memory cache shared by the process
+        '''
+        self.correction_cache = correction_cache
+
     def not_number(self,word):
         '''
         checks if there is a number in the string
@@ -48,119 +145,70 @@ class TextFeatureExtractor:
         :param tokens: the tokens
         :return: a clean token list
         '''
-        stop_words = stopwords.words('english')
+        stop_words = get_stop_words()
         return [word for word in tokens if word not in stop_words and len(word) > 1 and self.not_number(word)]
 
 
 
 
-    def getWordFreaquency(self,tokens):
-        '''
-        counts the accurances of words
-        :param tokens: list of tokens
-        :return: a dictianary: key = token, value=accurances
+    def tokenize(self,lyrics):
         '''
-        dic = dict()
-        for token in tokens:
-            if token not in dic:
-                dic[token] = 1
-            else:
-                dic[token] = dic[token] + 1
-
-        return dic
-
-
-    def feature_most_freaquent(self,dictianery,total_word_count):
-        '''
-        feature: the most frequen
-        :param dictianery:
-        :param total_word_count:
-        :return:
+        tokenizes the lyrics once, line by line. all the features are computed from these tokens
+        :param lyrics: the lyrics string
+        :return: a list with the (lower case) tokens of every non empty line
         '''
-        max_value = 0;
-        max_key = ""
-        for word in dictianery:
-            if max_value < dictianery[word]:
-                max_value = dictianery[word]
-                max_key = word
+        word_tokenize = get_word_tokenizer()
+        return [word_tokenize(line.lower()) for line in lyrics.split('\n') if line]
 
-        return max_value/total_word_count
 
-
-    def feature_repettive(self,tokens):
+    def correctSpellCheck(self,lines):
         '''
-        this feature checks ratio of the word usage within all the words in the song
-        :param tokens: a list of tokens
-        :return: the feature value
+        will spell check and corect the given lyrics
+        :param lines: the tokens of every line (see tokenize)
+        :return: a list of corrected sentences
         '''
-        total_size = len(tokens)
-        unique_size = len(set(tokens))
-        return unique_size/total_size
+        spell = get_spell_checker()
+        correction_cache = self.correction_cache if self.correction_cache is not None else get_correction_cache()
+        misspelled = spell.unknown({word for words in lines for word in words})
+        spellchecker = correction_cache.correct(spell, misspelled)
 
+        return [" ".join(spellchecker.get(word, word) for word in words) for words in lines]
 
 
 
-
-    def correctSpellCheck(self,sentences,lyrics):
+    def offensive_probabilities(self,sentences):
         '''
-        will spell check and corect the given lyrics
+        scores sentences with the profanity model. every distinct sentence is scored once, all in a single call
+        (choruses repeat the same line many times)
         :param sentences: a list of sentences
-        :param lyrics: all of the text combined as a string
-        :return: a list of corrected sentences
+        :return: a dictionary: key = sentence, value = the probability that it is offensive
         '''
-        spell = SpellChecker()
-        spellchecker = dict()
-        misspelled = list(set(spell.unknown(word_tokenize(lyrics))))
-        for word in misspelled:
-            spellchecker[word] = spell.correction(word)
-
-        for j in range(len(sentences)):
-            words = word_tokenize(sentences[j].lower())
-            for i in range(len(words)):
-
-                if words[i] in spellchecker:
-                    words[i] = spellchecker[words[i]]
-
-            fixed_sentence = ""
-            for word in words:
-                fixed_sentence +=  word + " "
-            sentences[j] = fixed_sentence[:-1]
-        return sentences;
+        unique_sentences = list(dict.fromkeys(sentences))
+        if not unique_sentences:
+            return {}
+        return dict(zip(unique_sentences, get_profanity_predictor()(unique_sentences)))
 
 
-
-    def feature_offensive(self,lyrics):
+    def feature_offensive_many(self,songs_lines):
         '''
-        the feature check how offensive the lyrics are ( (total number og ofensive sentences)/(total number of sentences) )
-        :param lyrics: the lyrics string
-        :return: the feature value
+        the offensive feature of several songs, the lines of all the songs are scored together
+        :param songs_lines: a list with the tokens of every line of every song (see tokenize)
+        :return: a list with the feature value of every song
         '''
-        sentences = lyrics.split('\n')
-        sentences = list(filter(lambda x: x is not None and x!= '' and len(x) >= 1, sentences))
-        sentence_count = len(sentences)
-        sentences = self.correctSpellCheck(sentences, lyrics)
-        offensive_count = 0
-
-        for sentence in sentences:
-            prob = predict_prob([sentence])
-            if prob >= 0.3:
-                offensive_count += 1
+        songs_sentences = [self.correctSpellCheck(lines) for lines in songs_lines]
+        probabilities = self.offensive_probabilities([sentence for sentences in songs_sentences
+                                                      for sentence in sentences])
+        return [sum(1 for sentence in sentences if probabilities[sentence] >= 0.3)/len(sentences)
+                for sentences in songs_sentences]
 
-        return offensive_count/sentence_count
 
-    def feature_slang(self,lyrics,tokens):
+    def feature_offensive(self,lines):
         '''
-        this feature check the ration between the mispelled words in the song to all the words in the song
-        :param lyrics: lyrics string
-        :param tokens: list of tokens
-        :return: the features value
+        the feature check how offensive the lyrics are ( (total number og ofensive sentences)/(total number of sentences) )
+        :param lines: the tokens of every line (see tokenize)
+        :return: the feature value
         '''
-        spell = SpellChecker()
-        word_tokenize(lyrics)
-        misspelled = spell.unknown(tokens)
-        return 1 - len(set(misspelled))/len(set(tokens))
-
-
+        return self.feature_offensive_many([lines])[0]
 
     def extract(self,lyrics):
         '''
@@ -170,20 +218,99 @@ class TextFeatureExtractor:
         :param lyrics: string of the lyrics
         :return: a dictionary with all the featers
         '''
-        if not lyrics:
-            return {"most Freq": None, "repetitive": None, "offensive": None, "spellScheck": None}
-        lyrics = lyrics.replace("\'s", '')
-        lyrics = lyrics.replace("\'", '')
+        return self.extract_batch([lyrics])[0]
 
-        tokens = word_tokenize(lyrics.lower())
-        tokens = self.removeStopWords(tokens)
-        total_word_count = len(tokens)
 
-        dictionary = self.getWordFreaquency(tokens)
+    def extract_batch(self,lyrics_list):
+        '''
+        the corpus inteface: generates the 4 features of many songs at once, the lines of all the songs are scored by
+        the profanity model in a single call
+        :param lyrics_list: a list of lyrics strings
+        :return: a list with the features dictionary of every song (see extract)
+        '''
+        features = []
+        songs = []
+        songs_lines = []
+        songs_tokens = []
+        for lyrics in lyrics_list:
+            features.append({"most Freq": None, "repetitive": None, "offensive": None, "spellScheck": None})
+            if not lyrics:
+                continue
+            lyrics = lyrics.replace("\'s", '')
+            lyrics = lyrics.replace("\'", '')
+
+            lines = self.tokenize(lyrics)
+            songs.append(len(features) - 1)
+            songs_lines.append(lines)
+            songs_tokens.append(self.removeStopWords([token for words in lines for token in words]))
+
+        most_frequent, repetitive, slang = self.lexical_features(songs_tokens)
+        offensive = self.feature_offensive_many(songs_lines)
+        for i, feature1, feature2, feature3, feature4 in zip(songs, most_frequent, repetitive, offensive, slang):
+            features[i] = {"most Freq" : float(feature1), "repetitive" : float(feature2), "offensive" : feature3,
+                           "spellScheck" : float(feature4)}
+        return features
+
+
+    def term_matrix(self,songs_tokens):
+        '''
+        counts the tokens of many songs in a sparse document-term matrix, with a vocabulary shared by the songs
+        :param songs_tokens: a list with the tokens of every song
+        :return: (scipy CSR matrix, list) the matrix (a row per song, a column per word, values = accurances) and the
+                 vocabulary (the word of every column)
+        '''
+        from scipy.sparse import csr_matrix
+        vocabulary = dict()
+        indices = [vocabulary.setdefault(token, len(vocabulary)) for tokens in songs_tokens for token in tokens]
+        indptr = np.cumsum([0] + [len(tokens) for tokens in songs_tokens])
+        matrix = csr_matrix((np.ones(len(indices), dtype=np.int32), indices, indptr),
+                            shape=(len(songs_tokens), len(vocabulary)))
+        matrix.sum_duplicates()
+        return matrix, list(vocabulary)
 
-        feature1 = self.feature_most_freaquent(dictionary,total_word_count)
-        feature2 = self.feature_repettive(tokens)
-        feature3 = self.feature_offensive(lyrics)
-        feature4 = self.feature_slang(lyrics,tokens)
 
-        return {"most Freq" : feature1, "repetitive" : feature2, "offensive" : feature3, "spellScheck" : feature4}
+    def lexical_features(self,songs_tokens):
+        '''
+        the most frequent, repetitive and spellcheck features of many songs, as row reductions of their term matrix
+        :param songs_tokens: a list with the tokens of every song (without stop words, see removeStopWords)
+        :return: (np array, np array, np array) the most frequent, repetitive and spellcheck features of every song
+        :raise: ZeroDivisionError if a song has no tokens
+        '''
+        if not songs_tokens:
+            return np.empty(0), np.empty(0), np.empty(0)
+        matrix, vocabulary = self.term_matrix(songs_tokens)
+        total_word_count = np.asarray(matrix.sum(axis=1)).ravel()
+        if np.any(total_word_count == 0):
+            raise ZeroDivisionError('no words are left in the lyrics after removing the stop words')
+        max_count = matrix.max(axis=1).toarray().ravel()
+        unique_count = np.diff(matrix.indptr)
+        misspelled = get_spell_checker().unknown(vocabulary)
+        misspelled_count = matrix.sign() @ np.array([word in misspelled for word in vocabulary], dtype=float)
+        return max_count/total_word_count, unique_count/total_word_count, 1 - misspelled_count/unique_count
+
+
+    def extract_many(self,lyrics_iterable,workers=1,chunksize=64):
+        '''
+        the corpus inteface: generates the 4 features of many songs (e.g. all the lyrics stored in the crawler json
+        files), using a pool of worker processes
+        :param lyrics_iterable: the lyrics strings (None or empty for songs with no lyrics)
+        :param workers: number of worker processes, 1 to extract in this process
+        :param chunksize: number of songs sent to a worker at once (their lines are scored by the profanity model in
+                          a single call)
+        :return: a numpy float array, a row per song (in the given order) and a column per feature (ordered as
+                 TEXT_FEATURE_LABELS), NaN rows for songs with no lyrics or that could not be processed
+        '''
+        lyrics_iterator = iter(lyrics_iterable)
+        chunks = iter(lambda: list(islice(lyrics_iterator, chunksize)), [])
+        extract = partial(extract_chunk, correction_cache=self.correction_cache)
+        if workers <= 1:
+            results = [extract(chunk) for chunk in chunks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=warm_resources) as executor:
+                # map keeps the results in the order of the given chunks
+                results = list(executor.map(extract, chunks))
+
+        rows = [[np.nan if features is None or features[label] is None else features[label]
+                 for label in TEXT_FEATURE_LABELS]
+                for chunk in results for features in chunk]
+        return np.array(rows, dtype=float).reshape(len(rows), len(TEXT_FEATURE_LABELS))